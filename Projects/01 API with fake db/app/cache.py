@@ -0,0 +1,35 @@
+import hashlib
+from collections.abc import Callable
+
+from store import StoreVersion
+
+
+class VersionedBody:
+    """A pre-encoded response body, rendered once per store version.
+
+    Every write publishes a new store version, so comparing version numbers is
+    enough to know whether the cached body is still valid. The ETag is a hash of
+    the body, so it stays valid across restarts.
+    """
+
+    def __init__(self, render: Callable[[StoreVersion], bytes]):
+        self.render = render
+        self._cached: tuple[int, bytes, str] | None = None
+
+    def get(self, version: StoreVersion) -> tuple[bytes, str]:
+        cached = self._cached
+        if cached is None or cached[0] != version.number:
+            body = self.render(version)
+            etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            cached = self._cached = (version.number, body, etag)
+        return cached[1], cached[2]
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Evaluate an `If-None-Match` header against the current ETag."""
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
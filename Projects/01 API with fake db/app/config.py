@@ -0,0 +1,21 @@
+from pathlib import Path
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    data_dir: Path = Path("data")
+    fsync_interval: float = 0.05
+    snapshot_interval: float = 60.0
+    # Number of recent item changes held for /items/changes.
+    feed_capacity: int = 65_536
+    # Set to share the items between worker processes through shared memory.
+    shared_memory_name: str | None = None
+    shared_capacity: int = 1_000_000
+    shared_name_width: int = 32
+    shared_log_capacity: int = 65_536
+
+    model_config = SettingsConfigDict(env_file=".env")
+
+
+settings = Settings()
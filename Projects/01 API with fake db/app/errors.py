@@ -0,0 +1,76 @@
+from fastapi import HTTPException, status
+
+
+class ItemNotFound(HTTPException):
+    def __init__(self, item_id: int):
+        status_code = status.HTTP_404_NOT_FOUND
+        detail = f"Item with {item_id=} does not exist."
+        super().__init__(status_code, detail)
+
+
+class ItemAlreadyExists(HTTPException):
+    def __init__(self, item_id: int):
+        status_code = status.HTTP_400_BAD_REQUEST
+        detail = f"Item with {item_id=} already exists."
+        super().__init__(status_code, detail)
+
+
+class NoUpdateParameters(HTTPException):
+    def __init__(self):
+        status_code = status.HTTP_400_BAD_REQUEST
+        detail = "No parameters provided for updates."
+        super().__init__(status_code, detail)
+
+
+class InsufficientStock(HTTPException):
+    def __init__(self, item_id: int, available: int, requested: int):
+        status_code = status.HTTP_409_CONFLICT
+        detail = (
+            f"Item with {item_id=} has {available} instances in stock, "
+            f"{requested} requested."
+        )
+        super().__init__(status_code, detail)
+
+
+class CountOverflow(HTTPException):
+    def __init__(self, item_id: int, count: int, added: int, maximum: int):
+        status_code = status.HTTP_409_CONFLICT
+        detail = (
+            f"Item with {item_id=} has {count} instances in stock, "
+            f"adding {added} would exceed the maximum of {maximum}."
+        )
+        super().__init__(status_code, detail)
+
+
+class InvalidCursor(HTTPException):
+    def __init__(self, order_by: str):
+        status_code = status.HTTP_400_BAD_REQUEST
+        if order_by == "id":
+            detail = "Items ordered by id are paginated with after_id only."
+        else:
+            detail = (
+                f"Items ordered by {order_by} are paginated with after_price, "
+                "optionally with after_id."
+            )
+        super().__init__(status_code, detail)
+
+
+class CatalogFull(HTTPException):
+    def __init__(self, capacity: int):
+        status_code = status.HTTP_507_INSUFFICIENT_STORAGE
+        detail = f"The shared item catalog is full ({capacity} items)."
+        super().__init__(status_code, detail)
+
+
+class NameTooLong(HTTPException):
+    def __init__(self, width: int):
+        status_code = status.HTTP_400_BAD_REQUEST
+        detail = f"Names of items in the shared catalog are limited to {width} bytes."
+        super().__init__(status_code, detail)
+
+
+class CatalogStalled(HTTPException):
+    def __init__(self):
+        status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        detail = "The shared item catalog is held by a write that did not finish."
+        super().__init__(status_code, detail)
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import secrets
+import threading
+from bisect import bisect_right
+from collections import deque
+from itertools import islice, takewhile
+from typing import NamedTuple
+
+from store import CATEGORIES, Columns
+
+
+class Batch(NamedTuple):
+    """The events of one write, numbered from `first`, as columns of item rows."""
+
+    first: int
+    op: str
+    # None for a reset; only "ids" for deletions.
+    columns: Columns | None
+
+    @property
+    def count(self) -> int:
+        return 1 if self.columns is None else len(self.columns["ids"])
+
+
+class ChangeFeed:
+    """The latest item mutations, numbered, for clients following the changes.
+
+    Every added, updated or deleted item is an event with the next sequence
+    number. A ring holds at least the last `capacity` events, kept as the columns
+    of the rows each write changed; events are encoded only when sent.
+
+    Event ids are `<epoch>-<seq>`, with an epoch drawn when the feed is created:
+    a client resuming from an id this feed did not issue, or from an event that
+    is no longer held, gets a `reset` event and must re-read the items.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.epoch = secrets.token_hex(4)
+        self.seq = 0
+        self._batches: deque[Batch] = deque()
+        self._held = 0
+        self._lock = threading.Lock()
+        self._waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    def publish(self, op: str, columns: Columns | None = None) -> None:
+        """Add an event per row of `columns`, or a single reset event if None."""
+        batch_size = 1 if columns is None else len(columns["ids"])
+        if not batch_size:
+            return
+        with self._lock:
+            skipped = max(batch_size - self.capacity, 0)
+            if skipped:
+                # The first events of the write would be dropped right away.
+                columns = {
+                    name: column[skipped:].copy() for name, column in columns.items()
+                }
+            batch = Batch(self.seq + skipped + 1, op, columns)
+            self._batches.append(batch)
+            self.seq += batch_size
+            self._held += batch.count
+            while self._held - self._batches[0].count >= self.capacity:
+                self._held -= self._batches.popleft().count
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The loop of a client that is gone was closed.
+                pass
+
+    def resume_point(self, last_event_id: str | None) -> int | None:
+        """Return the sequence number to resume after, or None if the client must reset.
+
+        Without an id, the client only gets the events published from now on.
+        """
+        if last_event_id is None:
+            return self.seq
+        epoch, _, seq = last_event_id.partition("-")
+        # isdigit() alone also accepts digits int() does not parse, such as "²".
+        if epoch != self.epoch or not (seq.isascii() and seq.isdigit()):
+            return None
+        return int(seq)
+
+    def events_after(self, seq: int, limit: int) -> list[bytes] | None:
+        """Return up to `limit` encoded events following `seq`, or None if some of
+        them are no longer held."""
+        with self._lock:
+            first = self._batches[0].first if self._batches else self.seq + 1
+            if not first - 1 <= seq <= self.seq:
+                return None
+            # The batch holding event `seq + 1` and the ones after it, up to the limit.
+            start = bisect_right(self._batches, seq, key=lambda batch: batch.first)
+            batches = list(
+                takewhile(
+                    lambda batch: batch.first <= seq + limit,
+                    islice(self._batches, max(start - 1, 0), None),
+                )
+            )
+        events = []
+        for batch in batches:
+            offset = max(seq + 1 - batch.first, 0)
+            stop = min(batch.count, offset + limit - len(events))
+            if offset < stop:
+                events.extend(self._encode(batch, offset, stop))
+        return events
+
+    def reset_event(self, seq: int) -> bytes:
+        """Tell a client to re-read the items and follow the events after `seq`."""
+        return self._frame(seq, "reset", {"seq": seq})
+
+    async def wait(self, seq: int, timeout: float) -> None:
+        """Wait until an event after `seq` is published, or `timeout` seconds pass."""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            if self.seq > seq:
+                return
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    def _encode(self, batch: Batch, start: int, stop: int) -> list[bytes]:
+        if batch.columns is None:
+            return [self._frame(batch.first, "reset", {"seq": batch.first})]
+        ids = batch.columns["ids"][start:stop].tolist()
+        seqs = range(batch.first + start, batch.first + stop)
+        if batch.op == "delete":
+            return [
+                self._frame(seq, "delete", {"seq": seq, "id": item_id})
+                for seq, item_id in zip(seqs, ids)
+            ]
+        rows = zip(
+            seqs,
+            ids,
+            batch.columns["names"][start:stop].tolist(),
+            batch.columns["prices"][start:stop].tolist(),
+            batch.columns["counts"][start:stop].tolist(),
+            batch.columns["categories"][start:stop].tolist(),
+        )
+        return [
+            self._frame(
+                seq,
+                batch.op,
+                {
+                    "seq": seq,
+                    "id": item_id,
+                    "item": {
+                        "id": item_id,
+                        "name": name.decode(),
+                        "price": price,
+                        "count": count,
+                        "category": CATEGORIES[category].value,
+                    },
+                },
+            )
+            for seq, item_id, name, price, count, category in rows
+        ]
+
+    def _frame(self, seq: int, op: str, data: dict) -> bytes:
+        return (
+            f"id: {self.epoch}-{seq}\nevent: {op}\ndata: {json.dumps(data)}\n\n"
+        ).encode()
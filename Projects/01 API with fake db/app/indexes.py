@@ -0,0 +1,180 @@
+import numpy as np
+
+
+class ValueIndex:
+    """Row positions of a table, ordered by the value of one column.
+
+    Rows with equal values keep their position order, so a lookup returns the
+    matching positions sorted, in O(log n + k). Positions are stored in the
+    smallest integer type that holds them, two bytes for a full table.
+    """
+
+    def __init__(self, values: np.ndarray):
+        self.order = np.argsort(values, kind="stable").astype(
+            np.min_scalar_type(max(len(values) - 1, 0))
+        )
+        self.values = values[self.order]
+
+    def lookup(self, value: int | float) -> np.ndarray:
+        start = np.searchsorted(self.values, value, side="left")
+        end = np.searchsorted(self.values, value, side="right")
+        return self.order[start:end]
+
+    def starting_with(self, prefix: bytes) -> np.ndarray:
+        """Return the positions of the byte strings starting with `prefix`, sorted."""
+        width = self.values.dtype.itemsize
+        if len(prefix) > width:
+            return self.order[:0]
+        start = np.searchsorted(self.values, prefix, side="left")
+        # No UTF-8 string contains the byte 0xff, so every string starting with
+        # the prefix sorts before it; a prefix as wide as the column can only be
+        # matched exactly.
+        if len(prefix) < width:
+            end = np.searchsorted(self.values, prefix + b"\xff", side="left")
+        else:
+            end = np.searchsorted(self.values, prefix, side="right")
+        return np.sort(self.order[start:end])
+
+
+class TrigramIndex:
+    """Inverted index from the 3-byte substrings of byte strings to their positions.
+
+    A fragment of at least three bytes can only occur in strings holding all of
+    its trigrams, so intersecting their postings gives a small superset of the
+    matches, which the caller verifies.
+    """
+
+    def __init__(self, values: np.ndarray):
+        rows, width = len(values), values.dtype.itemsize
+        codes = values.view(np.uint8).reshape(rows, width).astype(np.int64)
+        grams = codes[:, :-2] << 16 | codes[:, 1:-1] << 8 | codes[:, 2:]
+        # Trigrams reaching into the padding after a string are not indexed.
+        lengths = np.char.str_len(values)
+        valid = np.arange(3, width + 1) <= lengths[:, None]
+        positions = np.broadcast_to(np.arange(rows)[:, None], grams.shape)
+        # Sorting the (trigram, position) pairs groups the postings of every
+        # trigram, each one sorted and without repeated positions.
+        keys = np.unique(grams[valid] * max(rows, 1) + positions[valid])
+        self.grams = keys // max(rows, 1)
+        self.positions = (keys % max(rows, 1)).astype(
+            np.min_scalar_type(max(rows - 1, 0))
+        )
+
+    def lookup(self, fragment: bytes) -> np.ndarray:
+        """Return the positions of the strings holding every trigram of `fragment`."""
+        codes = np.frombuffer(fragment, dtype=np.uint8).astype(np.int64)
+        grams = np.unique(codes[:-2] << 16 | codes[1:-1] << 8 | codes[2:])
+        starts = np.searchsorted(self.grams, grams, side="left")
+        ends = np.searchsorted(self.grams, grams, side="right")
+        return intersect(
+            [self.positions[start:end] for start, end in zip(starts, ends)]
+        )
+
+
+def bound(values: np.ndarray, order: np.ndarray, value: float, position: int) -> int:
+    """Return how many rows of a value ordering come before `(value, position)`.
+
+    `order` holds row positions sorted by value, ties by position, and `values`
+    their values in that order.
+    """
+    start = np.searchsorted(values, value, side="left")
+    end = np.searchsorted(values, value, side="right")
+    return int(start + np.searchsorted(order[start:end], position))
+
+
+def intersect(postings: list[np.ndarray]) -> np.ndarray:
+    """Intersect sorted position arrays, starting from the smallest one.
+
+    Every step only probes the surviving candidates, so the cost is bounded by
+    the most selective posting rather than by the table size.
+    """
+    smallest, *others = sorted(postings, key=len)
+    for other in others:
+        if not len(smallest) or not len(other):
+            return smallest[:0]
+        found = np.searchsorted(other, smallest).clip(max=len(other) - 1)
+        smallest = smallest[other[found] == smallest]
+    return smallest
+
+
+class TableIndexes:
+    """Secondary indexes over the columns of one `ItemTable`, built on first use."""
+
+    def __init__(
+        self,
+        categories: np.ndarray,
+        counts: np.ndarray,
+        prices: np.ndarray,
+        names: np.ndarray,
+    ):
+        self._columns = {"category": categories, "count": counts, "price": prices}
+        self._indexes: dict[str, ValueIndex] = {}
+        self._names = names
+        self._lowered: np.ndarray | None = None
+        self._trigrams: TrigramIndex | None = None
+
+    def candidates(
+        self,
+        price: float | None = None,
+        count: int | None = None,
+        category: int | None = None,
+        name: bytes | None = None,
+        name_prefix: bytes | None = None,
+    ) -> np.ndarray | None:
+        """Return the positions matching every given filter, or None if none was given.
+
+        `name` and `name_prefix` are lowercased and UTF-8 encoded. Names are
+        matched through the sorted lowercased names (prefixes) and the trigram
+        index (fragments of three bytes or more); only shorter fragments are
+        searched for in every remaining name.
+        """
+        filters = {"price": price, "count": count, "category": category}
+        postings = [
+            self.index(column).lookup(value)
+            for column, value in filters.items()
+            if value is not None
+        ]
+        if name_prefix is not None:
+            postings.append(self.index("name").starting_with(name_prefix))
+        if name is not None and len(name) >= 3:
+            postings.append(self.trigrams.lookup(name))
+        if postings:
+            positions = intersect(postings)
+        elif name is not None:
+            positions = np.arange(len(self._names))
+        else:
+            return None
+        if name is not None:
+            positions = positions[np.char.find(self.lowered[positions], name) >= 0]
+        return positions
+
+    # Tables are immutable, so an index never goes stale; at worst two threads
+    # build the same one concurrently.
+
+    @property
+    def lowered(self) -> np.ndarray:
+        """The lowercased names, UTF-8 encoded."""
+        if self._lowered is None:
+            names = self._names
+            if names.view(np.uint8).max(initial=0) < 0x80:
+                # Lowercasing ASCII bytes is the same as lowercasing the text.
+                self._lowered = np.char.lower(names)
+            else:
+                self._lowered = np.array(
+                    [name.decode().lower().encode() for name in names.tolist()],
+                    dtype=np.bytes_,
+                )
+        return self._lowered
+
+    @property
+    def trigrams(self) -> TrigramIndex:
+        if self._trigrams is None:
+            self._trigrams = TrigramIndex(self.lowered)
+        return self._trigrams
+
+    def index(self, column: str) -> ValueIndex:
+        index = self._indexes.get(column)
+        if index is None:
+            values = self.lowered if column == "name" else self._columns[column]
+            index = self._indexes[column] = ValueIndex(values)
+        return index
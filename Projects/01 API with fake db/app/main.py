@@ -1,38 +1,137 @@
-from enum import Enum
+import asyncio
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager
+from itertools import islice
 
-from fastapi import FastAPI, HTTPException, Path, Query
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel, Field
+import sample_data
+from cache import VersionedBody, etag_matches
+from config import settings
+from errors import ItemAlreadyExists, ItemNotFound, NoUpdateParameters
+from feed import ChangeFeed
+from fastapi import FastAPI, Header, HTTPException, Path, Query, Response, status
+from fastapi.responses import HTMLResponse, StreamingResponse
+from models import (
+    INT64_MAX,
+    NAME_PATTERN,
+    Category,
+    CategoryStats,
+    Item,
+    ItemOrder,
+    ItemPage,
+    ItemUpdate,
+    RowError,
+)
+from persistence import Journal
+from pydantic import TypeAdapter
+from store import ItemStore, StoreVersion
 
-app = FastAPI(
-    title="Items API",
-    description="We created an api for using items.",
-    version="0.1.0",
+if settings.shared_memory_name is None:
+    items = ItemStore()
+else:
+    # Imported only when needed: it relies on fcntl, which Windows lacks.
+    from shared import SharedCatalog, SharedItemStore
+
+    items = SharedItemStore(
+        SharedCatalog(
+            settings.shared_memory_name,
+            capacity=settings.shared_capacity,
+            name_width=settings.shared_name_width,
+            log_capacity=settings.shared_log_capacity,
+        )
+    )
+items.feed = feed = ChangeFeed(settings.feed_capacity)
+journal = Journal(
+    settings.data_dir,
+    fsync_interval=settings.fsync_interval,
+    snapshot_interval=settings.snapshot_interval,
 )
 
 
-class Category(Enum):
-    """Category of an item"""
+AllItems = dict[str, dict[int, Item]]
+all_items_adapter = TypeAdapter(AllItems)
+
+
+def render_all_items(version: StoreVersion) -> bytes:
+    return all_items_adapter.dump_json({"items": {item.id: item for item in version}})
+
+
+all_items_body = VersionedBody(render_all_items)
+
+NDJSON = "application/x-ndjson"
+NDJSON_BATCH = 1000
+item_adapter = TypeAdapter(Item)
+
+
+def stream_items(
+    version: StoreVersion, after_id: int | None, limit: int | None
+) -> Iterator[bytes]:
+    selection = islice(version.items_after(after_id), limit)
+    while batch := list(islice(selection, NDJSON_BATCH)):
+        yield b"".join(item_adapter.dump_json(item) + b"\n" for item in batch)
+
 
-    TOOLS = "tools"
-    CONSUMABLES = "consumables"
+EVENT_STREAM = "text/event-stream"
+EVENT_BATCH = 1000
+# With several workers, how often a stream checks for the writes of the others.
+CHANGES_POLL_INTERVAL = 0.25
+# Proxies tend to close connections that stay silent for a minute.
+KEEP_ALIVE_INTERVAL = 15.0
 
 
-class Item(BaseModel):
-    """Representation of an item in the system."""
+async def stream_changes(last_event_id: str | None) -> AsyncIterator[bytes]:
+    seq = feed.resume_point(last_event_id)
+    last_sent = time.monotonic()
+    while True:
+        events = None if seq is None else feed.events_after(seq, EVENT_BATCH)
+        if events is None:
+            seq = feed.seq
+            events = [feed.reset_event(seq)]
+        else:
+            seq += len(events)
+        if events:
+            yield b"".join(events)
+            last_sent = time.monotonic()
+            continue
+        if time.monotonic() - last_sent >= KEEP_ALIVE_INTERVAL:
+            yield b": keep-alive\n\n"
+            last_sent = time.monotonic()
+        if settings.shared_memory_name is None:
+            await feed.wait(seq, KEEP_ALIVE_INTERVAL)
+        else:
+            await feed.wait(seq, CHANGES_POLL_INTERVAL)
+            await asyncio.to_thread(items.refresh)
 
-    id: int = Field(description="Unique integer that specifies this item.")
-    name: str = Field(description="Name of the item.")
-    price: float = Field(description="Price of the item in Euro.")
-    count: int = Field(description="Amount of instances of this item in stock.")
-    category: Category = Field(description="Category this item belongs to.")
 
+def add_sample_items() -> None:
+    for item in sample_data.items:
+        items.add(item)
 
-items = {
-    1: Item(id=1, name="Hammer", price=9.99, count=20, category=Category.TOOLS),
-    2: Item(id=2, name="Pliers", price=5.99, count=20, category=Category.TOOLS),
-    3: Item(id=3, name="Nails", price=1.99, count=100, category=Category.CONSUMABLES),
-}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.shared_memory_name is not None:
+        with items.attached(journal) as is_first_run:
+            if is_first_run:
+                add_sample_items()
+            yield
+        return
+
+    is_first_run = journal.is_empty
+    journal.recover(items)
+    if is_first_run:
+        add_sample_items()
+    journal.start(items)
+    yield
+    journal.stop(items)
+
+
+app = FastAPI(
+    title="Items API",
+    description="We created an api for using items.",
+    version="0.1.0",
+    lifespan=lifespan,
+)
 
 
 @app.get("/")
@@ -44,55 +143,135 @@ def index():
     return HTMLResponse(content)
 
 
-@app.get("/items/all")
-def get_items() -> dict[str, dict[int, Item]]:
-    return {"items": items}
+@app.get(
+    "/items/all",
+    response_model=AllItems | ItemPage,
+    responses={
+        status.HTTP_200_OK: {"content": {NDJSON: {}}},
+        status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified"},
+    },
+)
+def get_items(
+    after_id: int | None = None,
+    limit: int | None = Query(default=None, gt=0, le=INT64_MAX),
+    accept: str | None = Header(default=None),
+    if_none_match: str | None = Header(default=None),
+) -> Response:
+    version = items.current
+    if accept is not None and NDJSON in accept:
+        return StreamingResponse(
+            stream_items(version, after_id, limit), media_type=NDJSON
+        )
+
+    if after_id is None and limit is None:
+        body, etag = all_items_body.get(version)
+        headers = {"ETag": etag}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(body, media_type="application/json", headers=headers)
+
+    selection = list(islice(version.items_after(after_id), limit))
+    is_last_page = limit is None or len(selection) < limit
+    page = ItemPage(
+        items={item.id: item for item in selection},
+        next_after_id=None if is_last_page else selection[-1].id,
+    )
+    return Response(page.model_dump_json(), media_type="application/json")
+
+
+# Declared before /items/{item_id}, which would otherwise take "changes" or
+# "stats" for an id.
+@app.get(
+    "/items/changes",
+    response_class=StreamingResponse,
+    responses={status.HTTP_200_OK: {"content": {EVENT_STREAM: {}}}},
+)
+def follow_changes(last_event_id: str | None = Header(default=None)):
+    return StreamingResponse(
+        stream_changes(last_event_id),
+        media_type=EVENT_STREAM,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/items/stats")
+def get_stats() -> dict[Category, CategoryStats]:
+    return items.stats()
 
 
 @app.get("/items/{item_id}")
 def query_item_by_id(item_id: int) -> Item:
-    if item_id not in items:
-        raise HTTPException(
-            status_code=404, detail=f"Item with {item_id=} does not exist."
-        )
-    return items[item_id]
+    return items.get(item_id)
 
 
-Selection = dict[str, str | int | float | Category | None]
+Selection = dict[str, str | int | float | Category | ItemOrder | None]
 
 
 @app.get("/items/")
 def query_item_by_parameter(
     name: str | None = None,
+    name_prefix: str | None = None,
     price: float | None = None,
     count: int | None = None,
     category: Category | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    min_count: int | None = None,
+    max_count: int | None = None,
+    order_by: ItemOrder = ItemOrder.ID,
+    top_k: int | None = Query(default=None, gt=0),
+    after_price: float | None = None,
+    after_id: int | None = None,
 ) -> dict[str, Selection | list[Item]]:
-    def check_item(item: Item) -> bool:
-        return all(
-            (
-                name is None or name.lower() in item.name.lower(),
-                price is None or item.price == price,
-                count is None or item.count == count,
-                category is None or item.category is category,
-            )
-        )
-
-    selection = list(filter(check_item, items.values()))
-    return {
-        "query": {"name": name, "price": price, "count": count, "category": category},
-        "selection": selection,
+    query = {
+        "name": name,
+        "name_prefix": name_prefix,
+        "price": price,
+        "count": count,
+        "category": category,
+        "min_price": min_price,
+        "max_price": max_price,
+        "min_count": min_count,
+        "max_count": max_count,
+        "order_by": order_by,
+        "top_k": top_k,
+        "after_price": after_price,
+        "after_id": after_id,
     }
+    return {"query": query, "selection": items.select(**query)}
 
 
 @app.post("/items/")
 def add_item(item: Item) -> dict[str, Item]:
     if item.id in items:
+        raise ItemAlreadyExists(item.id)
+    items.add(item)
+    return {"added": item}
+
+
+BulkResult = dict[str, int | list[RowError]]
+
+
+# With atomic=true a single failing row rejects the whole request; otherwise the
+# valid rows are applied and the failing ones are reported in "errors".
+@app.post("/items/bulk")
+def add_items(items_to_add: list[Item], atomic: bool = True) -> BulkResult:
+    errors = items.add_many(items_to_add, atomic=atomic)
+    if atomic and errors:
         raise HTTPException(
-            status_code=400, detail=f"Item with {item.id=} already exists."
+            status_code=400, detail=[error.model_dump() for error in errors]
         )
-    items[item.id] = item
-    return {"added": item}
+    return {"added": len(items_to_add) - len(errors), "errors": errors}
+
+
+@app.patch("/items/bulk")
+def update_items(updates: list[ItemUpdate], atomic: bool = True) -> BulkResult:
+    errors = items.update_many(updates, atomic=atomic)
+    if atomic and errors:
+        raise HTTPException(
+            status_code=400, detail=[error.model_dump() for error in errors]
+        )
+    return {"updated": len(updates) - len(errors), "errors": errors}
 
 
 # Path() : used for path string
@@ -100,30 +279,41 @@ def add_item(item: Item) -> dict[str, Item]:
 @app.put("/items/{item_id}")
 def update_item(
     item_id: int = Path(ge=0),
-    name: str | None = Query(default=None, min_length=1, max_length=8),
+    name: str | None = Query(
+        default=None, min_length=1, max_length=8, pattern=NAME_PATTERN
+    ),
     price: float | None = Query(default=None, gt=0.0),
-    count: int | None = Query(default=None, gt=0),
+    count: int | None = Query(default=None, gt=0, le=INT64_MAX),
 ) -> dict[str, Item]:
     if item_id not in items:
-        raise HTTPException(
-            status_code=404, detail=f"Item with {item_id=} does not exists."
-        )
+        raise ItemNotFound(item_id)
     if all(info is None for info in (name, price, count)):
-        raise HTTPException(
-            status_code=400, detail="No parameters provided for updates."
-        )
-    item = items[item_id]
-    item.name = name or item.name
-    item.price = price or item.price
-    item.count = count or item.count
+        raise NoUpdateParameters()
+    item = items.update(item_id, name=name, price=price, count=count)
     return {"updated": item}
 
 
+# Reserving is atomic: it takes the instances only if there are enough of them
+# in stock, so concurrent buyers can never take more than there are.
+@app.post("/items/{item_id}/reserve")
+def reserve_item(
+    item_id: int, quantity: int = Query(default=1, gt=0, le=INT64_MAX)
+) -> dict[str, Item]:
+    item = items.reserve(item_id, quantity)
+    return {"reserved": item}
+
+
+@app.post("/items/{item_id}/release")
+def release_item(
+    item_id: int, quantity: int = Query(default=1, gt=0, le=INT64_MAX)
+) -> dict[str, Item]:
+    item = items.release(item_id, quantity)
+    return {"released": item}
+
+
 @app.delete("/items/{item_id}")
 def delete_item(item_id: int) -> dict[str, Item]:
     if item_id not in items:
-        raise HTTPException(
-            status_code=404, detail=f"Item with {item_id=} does not exists."
-        )
-    item = items.pop(item_id)
+        raise ItemNotFound(item_id)
+    item = items.delete(item_id)
     return {"deleted": item}
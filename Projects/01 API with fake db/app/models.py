@@ -0,0 +1,83 @@
+from enum import Enum
+
+from pydantic import BaseModel, Field
+
+# Ids and counts are stored as 64-bit integers.
+INT64_MIN = -(2**63)
+INT64_MAX = 2**63 - 1
+# Names are stored in fixed-width byte columns, which drop trailing NUL bytes.
+NAME_PATTERN = r"^[^\x00]*$"
+
+
+class Category(Enum):
+    """Category of an item"""
+
+    TOOLS = "tools"
+    CONSUMABLES = "consumables"
+
+
+class ItemOrder(Enum):
+    """Order of selected items; ties are ordered by id."""
+
+    ID = "id"
+    PRICE = "price"
+    PRICE_DESCENDING = "-price"
+
+
+class Item(BaseModel):
+    """Representation of an item in the system."""
+
+    id: int = Field(
+        ge=INT64_MIN,
+        le=INT64_MAX,
+        description="Unique integer that specifies this item.",
+    )
+    name: str = Field(pattern=NAME_PATTERN, description="Name of the item.")
+    price: float = Field(description="Price of the item in Euro.")
+    count: int = Field(
+        ge=INT64_MIN,
+        le=INT64_MAX,
+        description="Amount of instances of this item in stock.",
+    )
+    category: Category = Field(description="Category this item belongs to.")
+
+
+class ItemPage(BaseModel):
+    """One page of items, ordered by id."""
+
+    items: dict[int, Item] = Field(description="Items of this page, by id.")
+    next_after_id: int | None = Field(
+        description="Pass as `after_id` to get the next page; null on the last page."
+    )
+
+
+class CategoryStats(BaseModel):
+    """Inventory figures of the items of one category."""
+
+    items: int = Field(description="Number of items.")
+    total_count: int = Field(description="Instances in stock, over all items.")
+    stock_value: float = Field(description="Sum of price * count, in Euro.")
+    min_price: float | None = Field(description="Lowest price; null without items.")
+    max_price: float | None = Field(description="Highest price; null without items.")
+    avg_price: float | None = Field(
+        description="Average price of the items; null without items."
+    )
+
+
+class ItemUpdate(BaseModel):
+    """Partial update of one item; fields left out keep their current value."""
+
+    id: int = Field(ge=0, le=INT64_MAX, description="Id of the item to update.")
+    name: str | None = Field(
+        default=None, min_length=1, max_length=8, pattern=NAME_PATTERN
+    )
+    price: float | None = Field(default=None, gt=0.0)
+    count: int | None = Field(default=None, gt=0, le=INT64_MAX)
+
+
+class RowError(BaseModel):
+    """Why one row of a bulk request was rejected."""
+
+    index: int = Field(description="Position of the row in the request body.")
+    id: int = Field(description="Id of the item in that row.")
+    detail: str
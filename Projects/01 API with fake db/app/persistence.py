@@ -0,0 +1,221 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+SNAPSHOT_MAGIC = b"ITEMSNP1"
+# magic, sequence number of the last mutation included, row count, names length
+SNAPSHOT_HEADER = struct.Struct("<8sQQQ")
+# The snapshot columns, in file order. 8-byte columns come first to keep them aligned.
+SNAPSHOT_COLUMNS = (
+    ("ids", np.int64),
+    ("prices", np.float64),
+    ("counts", np.int64),
+    ("names", np.int32),
+    ("categories", np.int8),
+)
+
+Columns = dict[str, np.ndarray]
+
+
+def write_snapshot(path: Path, seq: int, columns: Columns, names: list[str]) -> None:
+    """Write a compacted snapshot atomically: to a temporary file, then renamed."""
+    names_blob = json.dumps(names).encode()
+    names_blob += b"\0" * (-len(names_blob) % 8)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as file:
+        file.write(
+            SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC, seq, len(columns["ids"]), len(names_blob)
+            )
+        )
+        file.write(names_blob)
+        for name, dtype in SNAPSHOT_COLUMNS:
+            file.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def read_snapshot(path: Path) -> Iterator[tuple[int, Columns, list[str]]]:
+    """Memory-map a snapshot and yield `(seq, columns, names)`.
+
+    The columns are views into the mapping, so they must be copied before the
+    context exits.
+    """
+    with open(path, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buffer:
+        magic, seq, rows, names_length = SNAPSHOT_HEADER.unpack_from(buffer)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not an item snapshot.")
+        offset = SNAPSHOT_HEADER.size
+        names = json.loads(buffer[offset : offset + names_length].rstrip(b"\0"))
+        offset += names_length
+        columns = {}
+        for name, dtype in SNAPSHOT_COLUMNS:
+            columns[name] = np.frombuffer(
+                buffer, dtype=dtype, count=rows, offset=offset
+            )
+            offset += rows * np.dtype(dtype).itemsize
+        try:
+            yield seq, columns, names
+        finally:
+            # Release the views so the mapping can be closed.
+            columns.clear()
+
+
+def read_log(path: Path) -> Iterator[dict]:
+    with open(path, "rb") as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A torn record at the end of the log, written during a crash.
+                logger.warning(f"Ignoring a truncated record at the end of {path}.")
+                return
+
+
+class Journal:
+    """Durability for an `ItemStore`: an append-only mutation log plus snapshots.
+
+    Every mutation is appended to the current log segment and the segment is
+    fsynced in batches, every `fsync_interval` seconds. Every `snapshot_interval`
+    seconds the store is written to a compacted binary snapshot, a new segment is
+    started and the segments covered by the snapshot are removed. On startup the
+    snapshot is loaded and only the log tail written after it is replayed.
+
+    A crash can lose the mutations of the last `fsync_interval` seconds.
+    """
+
+    def __init__(self, data_dir: Path, fsync_interval: float, snapshot_interval: float):
+        self.data_dir = data_dir
+        self.snapshot_path = data_dir / "items.snapshot"
+        self.fsync_interval = fsync_interval
+        self.snapshot_interval = snapshot_interval
+        self.seq = 0
+        self._snapshot_seq = 0
+        self._segment = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        data_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.snapshot_path.exists() and not self._segments()
+
+    def recover(self, store) -> None:
+        """Load the latest snapshot into `store` and replay the log written after it."""
+        started = time.perf_counter()
+        if self.snapshot_path.exists():
+            with read_snapshot(self.snapshot_path) as (seq, columns, names):
+                store.load(columns, names)
+            self.seq = self._snapshot_seq = seq
+        replayed = 0
+        for segment in self._segments():
+            for record in read_log(segment):
+                if record["seq"] <= self.seq:
+                    continue
+                store.apply(record)
+                self.seq = record["seq"]
+                replayed += 1
+        self._open_segment()
+        store.journal = self
+        logger.info(
+            f"Recovered {len(store)} items ({replayed} log records replayed) "
+            f"in {time.perf_counter() - started:.3f}s."
+        )
+
+    def resume(self, store) -> None:
+        """Take over the journal for a store that is already up to date.
+
+        Used when the items are kept by other processes as well: the store is not
+        loaded from disk; the log is only scanned for its last sequence number and a
+        snapshot is written, since it may lack writes nobody logged.
+        """
+        if self.snapshot_path.exists():
+            with read_snapshot(self.snapshot_path) as (seq, _, _):
+                self.seq = self._snapshot_seq = seq
+        for segment in self._segments():
+            for record in read_log(segment):
+                self.seq = max(self.seq, record["seq"])
+        self._open_segment()
+        store.journal = self
+        self.snapshot(store, force=True)
+
+    def record(self, op: str, **fields) -> None:
+        """Append one mutation to the log. Called by the store under its write lock."""
+        with self._lock:
+            self.seq += 1
+            line = json.dumps({"seq": self.seq, "op": op, **fields})
+            self._segment.write(line.encode() + b"\n")
+            self._dirty = True
+
+    def sync(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            self._segment.flush()
+            os.fsync(self._segment.fileno())
+            self._dirty = False
+
+    def snapshot(self, store, force: bool = False) -> None:
+        with store.lock:
+            if self.seq == self._snapshot_seq and not force:
+                return
+            seq = self.seq
+            version = store.current
+            self._open_segment()
+        columns, names = store.export(version)
+        write_snapshot(self.snapshot_path, seq, columns, names)
+        self._snapshot_seq = seq
+        for segment in self._segments()[:-1]:
+            segment.unlink()
+        logger.info(f"Wrote a snapshot of {len(columns['ids'])} items at {seq=}.")
+
+    def start(self, store) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, args=(store,), daemon=True)
+        self._thread.start()
+
+    def stop(self, store) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.snapshot(store)
+        with self._lock:
+            self._segment.close()
+
+    def _run(self, store) -> None:
+        last_snapshot = time.monotonic()
+        while not self._stopped.wait(self.fsync_interval):
+            store.refresh()
+            self.sync()
+            if time.monotonic() - last_snapshot >= self.snapshot_interval:
+                self.snapshot(store)
+                last_snapshot = time.monotonic()
+
+    def _segments(self) -> list[Path]:
+        return sorted(self.data_dir.glob("items-*.log"))
+
+    def _open_segment(self) -> None:
+        """Start a new log segment, named after the first sequence number it will hold."""
+        with self._lock:
+            if self._segment is not None:
+                self._segment.flush()
+                os.fsync(self._segment.fileno())
+                self._segment.close()
+            path = self.data_dir / f"items-{self.seq + 1:020d}.log"
+            self._segment = open(path, "ab")
+            self._dirty = False
@@ -0,0 +1,7 @@
+from models import Category, Item
+
+items = [
+    Item(id=1, name="Hammer", price=9.99, count=20, category=Category.TOOLS),
+    Item(id=2, name="Pliers", price=5.99, count=20, category=Category.TOOLS),
+    Item(id=3, name="Nails", price=1.99, count=100, category=Category.CONSUMABLES),
+]
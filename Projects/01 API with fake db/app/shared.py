@@ -0,0 +1,457 @@
+import fcntl
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+from errors import CatalogFull, CatalogStalled, NameTooLong
+from loguru import logger
+from persistence import Journal
+from store import COLUMNS, Columns, ItemStore, ItemTable, StoreVersion, build_tables
+
+# Slots of the segment header, a row of uint64 values.
+SEQ, ROWS, CHANGES, ATTACHED, CAPACITY, NAME_WIDTH, LOG_CAPACITY = range(7)
+HEADER_SLOTS = 8
+# How long a reader waits for a write in progress before giving up, in seconds.
+READ_TIMEOUT = 5.0
+
+
+class SharedCatalog:
+    """Items kept in a `multiprocessing.shared_memory` segment, shared by processes.
+
+    The rows are stored unordered in columns of a fixed capacity; deleting a row
+    moves the last row into its place. Writes must be serialized by the caller.
+    Every write is bracketed by a seqlock: the version word `seq` is odd while a
+    write is in progress and even otherwise, so a reader that sees the same even
+    value before and after copying rows knows that its copy is consistent. The ids
+    changed by every write are appended to a ring, so that a reader can catch up
+    by copying only the rows changed since it last looked.
+
+    Like any seqlock, this relies on the stores of the writer becoming visible to
+    other processes in program order, as they do on x86-64.
+    """
+
+    def __init__(self, name: str, capacity: int, name_width: int, log_capacity: int):
+        self.name = name
+        self.capacity = capacity
+        self.name_width = name_width
+        self.log_capacity = log_capacity
+        self.dtypes = {
+            column: np.dtype(f"S{name_width}" if column == "names" else dtype)
+            for column, dtype in COLUMNS
+        }
+        self.columns: Columns = {}
+        self._memory: shared_memory.SharedMemory | None = None
+        self._header: np.ndarray | None = None
+        self._log: np.ndarray | None = None
+
+    @property
+    def seq(self) -> int:
+        return int(self._header[SEQ])
+
+    @property
+    def rows(self) -> int:
+        return int(self._header[ROWS])
+
+    @property
+    def changes(self) -> int:
+        """The number of row changes written so far."""
+        return int(self._header[CHANGES])
+
+    def open(self) -> bool:
+        """Create the segment, or attach to it if it exists; return whether it was created."""
+        layout = (self.capacity, self.name_width, self.log_capacity)
+        row_size = sum(dtype.itemsize for dtype in self.dtypes.values())
+        size = 8 * (HEADER_SLOTS + self.log_capacity) + self.capacity * row_size
+        try:
+            memory = shared_memory.SharedMemory(self.name, create=True, size=size)
+            created = True
+        except FileExistsError:
+            memory = shared_memory.SharedMemory(self.name)
+            created = False
+        # Before Python 3.13, every process attached to the segment removes it when
+        # it exits; the last process to detach removes it instead.
+        resource_tracker.unregister(memory._name, "shared_memory")
+        self._memory = memory
+        self._header = np.ndarray(HEADER_SLOTS, np.uint64, buffer=memory.buf)
+        if created:
+            self._header[CAPACITY : LOG_CAPACITY + 1] = layout
+        elif tuple(self._header[CAPACITY : LOG_CAPACITY + 1].tolist()) != layout:
+            self.close()
+            raise ValueError(
+                f"The shared memory segment {self.name!r} has a different layout."
+            )
+        self._header[ATTACHED] += 1
+
+        offset = 8 * HEADER_SLOTS
+        self._log = np.ndarray(
+            self.log_capacity, np.int64, buffer=memory.buf, offset=offset
+        )
+        offset += 8 * self.log_capacity
+        for column, dtype in self.dtypes.items():
+            self.columns[column] = np.ndarray(
+                self.capacity, dtype, buffer=memory.buf, offset=offset
+            )
+            offset += self.capacity * dtype.itemsize
+        return created
+
+    def detach(self) -> bool:
+        """Stop counting this process as attached; return whether it was the last one."""
+        self._header[ATTACHED] -= 1
+        return int(self._header[ATTACHED]) == 0
+
+    def close(self, unlink: bool = False) -> None:
+        # The views into the segment must be released before it can be closed.
+        self.columns.clear()
+        self._header = self._log = None
+        self._memory.close()
+        if unlink:
+            # unlink() unregisters the segment from the resource tracker again.
+            resource_tracker.register(self._memory._name, "shared_memory")
+            self._memory.unlink()
+
+    def check(self, name_width: int, rows: int) -> None:
+        """Raise unless names of `name_width` bytes and a total of `rows` rows fit."""
+        if name_width > self.name_width:
+            raise NameTooLong(self.name_width)
+        if rows > self.capacity:
+            raise CatalogFull(self.capacity)
+
+    def read(
+        self,
+        seen_seq: int | None,
+        seen_changes: int | None,
+        timeout: float = READ_TIMEOUT,
+    ) -> tuple[int, int, Columns, np.ndarray | None] | None:
+        """Return a consistent copy of what changed since `seen_seq`, or None if nothing did.
+
+        Returns `(seq, changes, rows, ids)`, with the rows of the changed `ids` that
+        still exist. If the ring no longer reaches back to change `seen_changes`
+        (or it is None), all rows are returned and `ids` is None. Raises
+        `CatalogStalled` if no consistent copy could be made within `timeout`
+        seconds, as when the writer died in the middle of a write.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            seq = self.seq
+            if seq % 2:
+                # A write is in progress.
+                if time.monotonic() > deadline:
+                    raise CatalogStalled()
+                time.sleep(0)
+                continue
+            if seq == seen_seq:
+                return None
+            changes = self.changes
+            rows = self.rows
+            ids = None
+            if seen_changes is None or changes - seen_changes > self.log_capacity:
+                selected = slice(0, rows)
+            else:
+                positions = np.arange(seen_changes, changes) % self.log_capacity
+                ids = np.unique(self._log[positions])
+                selected = np.flatnonzero(np.isin(self.columns["ids"][:rows], ids))
+            copy = {
+                column: np.array(view[selected])
+                for column, view in self.columns.items()
+            }
+            if self.seq == seq:
+                return seq, changes, copy, ids
+
+    def repair(self) -> bool:
+        """Close the write of a process that died in the middle of it, if any.
+
+        Must be called holding the lock of the writers, so that an odd `seq` can
+        only have been left by a writer that is gone. The rows it was changing
+        may be half written and its changes were not logged, so every reader is
+        sent back to a full copy. Returns whether there was such a write.
+        """
+        if self.seq % 2 == 0:
+            return False
+        self._header[CHANGES] = self.changes + self.log_capacity + 1
+        self._header[SEQ] += 1
+        return True
+
+    def upsert(self, rows: Columns) -> None:
+        """Insert or replace `rows`, sorted by id without repeated ids."""
+        with self._writing(rows["ids"]):
+            count = self.rows
+            ids = self.columns["ids"][:count]
+            slots = np.flatnonzero(np.isin(ids, rows["ids"]))
+            existing = np.searchsorted(rows["ids"], ids[slots])
+            is_new = np.ones(len(rows["ids"]), dtype=bool)
+            is_new[existing] = False
+            targets = np.empty(len(rows["ids"]), dtype=np.intp)
+            targets[existing] = slots
+            targets[is_new] = count + np.arange(is_new.sum())
+            for column, view in self.columns.items():
+                view[targets] = rows[column]
+            self._header[ROWS] = count + int(is_new.sum())
+
+    def remove(self, ids: np.ndarray) -> None:
+        with self._writing(ids):
+            count = self.rows
+            removed = np.isin(self.columns["ids"][:count], ids)
+            left = count - int(removed.sum())
+            # Fill the holes below the new end with the surviving rows above it.
+            holes = np.flatnonzero(removed[:left])
+            movers = left + np.flatnonzero(~removed[left:count])
+            for view in self.columns.values():
+                view[holes] = view[movers]
+            self._header[ROWS] = left
+
+    def replace(self, columns: Columns) -> None:
+        with self._writing(None):
+            count = len(columns["ids"])
+            for column, view in self.columns.items():
+                view[:count] = columns[column]
+            self._header[ROWS] = count
+
+    @contextmanager
+    def _writing(self, ids: np.ndarray | None) -> Iterator[None]:
+        """Bracket a write with the seqlock and log the changed `ids`; None means all."""
+        self._header[SEQ] += 1
+        try:
+            yield
+        finally:
+            changes = self.changes
+            if ids is None:
+                # Send every reader back to a full copy.
+                changes += self.log_capacity + 1
+            else:
+                logged = ids[-self.log_capacity :]
+                end = changes + len(ids)
+                self._log[np.arange(end - len(logged), end) % self.log_capacity] = (
+                    logged
+                )
+                changes = end
+            self._header[CHANGES] = changes
+            self._header[SEQ] += 1
+
+
+class WriteLock:
+    """The write lock of a `SharedItemStore`.
+
+    It excludes the other threads, then the other processes through a lock file,
+    and brings the replica up to date before the write starts.
+    """
+
+    def __init__(self, store: "SharedItemStore"):
+        self.store = store
+
+    def __enter__(self) -> None:
+        self.store.replica_lock.acquire()
+        try:
+            fcntl.flock(self.store.lock_file, fcntl.LOCK_EX)
+            self.store.repair()
+            self.store.catch_up()
+        except BaseException:
+            self.__exit__()
+            raise
+
+    def __exit__(self, *exc_info) -> None:
+        fcntl.flock(self.store.lock_file, fcntl.LOCK_UN)
+        self.store.replica_lock.release()
+
+
+class SharedItemStore(ItemStore):
+    """An `ItemStore` whose items are shared by every process attached to a catalog.
+
+    Every process keeps its own store versions as a replica of the catalog. Before
+    a read, the replica catches up with the writes of the other processes, copying
+    only the rows they changed (or the whole catalog after a long pause). A write
+    takes the write lock of all processes, catches up, then applies the change to
+    the replica and to the catalog.
+
+    One process, the first to attach, owns the journal; it logs the writes of the
+    others as it catches up with them.
+    """
+
+    def __init__(self, catalog: SharedCatalog):
+        super().__init__()
+        self.catalog = catalog
+        self.replica_lock = threading.Lock()
+        self.lock = WriteLock(self)
+        self.lock_file = None
+        self._seen: tuple[int | None, int | None] = (None, None)
+        self._attached = False
+        self._unlogged = False
+
+    @property
+    def current(self) -> StoreVersion:
+        if self._attached and self.catalog.seq != self._seen[0]:
+            with self.replica_lock:
+                self._catch_up_reading()
+        return self._current
+
+    @current.setter
+    def current(self, version: StoreVersion) -> None:
+        self._current = version
+
+    @contextmanager
+    def attached(self, journal: Journal) -> Iterator[bool]:
+        """Attach to the catalog for the lifetime of the app.
+
+        The process that creates the catalog fills it from the journal; the
+        context value tells whether that was the first run, with no data yet.
+        """
+        self.lock_file = open(journal.data_dir / "items.lock", "wb")
+        owner_file = open(journal.data_dir / "journal.lock", "wb")
+        with self.replica_lock:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            try:
+                created = self.catalog.open()
+                self._attached = True
+                self.repair()
+                self.catch_up()
+                if created:
+                    # A previous owner may still be shutting down.
+                    fcntl.flock(owner_file, fcntl.LOCK_EX)
+                    is_first_run = journal.is_empty
+                    journal.recover(self)
+                else:
+                    is_first_run = False
+                is_owner = created or try_lock(owner_file)
+            finally:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        if is_owner and not created:
+            journal.resume(self)
+        if is_owner:
+            journal.start(self)
+        try:
+            yield is_first_run
+        finally:
+            # The last process to leave writes the final snapshot, as it may hold
+            # writes the owner never saw.
+            with self.lock:
+                is_last = self.catalog.detach()
+            if is_last and not is_owner:
+                fcntl.flock(owner_file, fcntl.LOCK_EX)
+                journal.resume(self)
+                is_owner = True
+            if is_owner:
+                journal.stop(self)
+            self._attached = False
+            self.catalog.close(unlink=is_last)
+            owner_file.close()
+            self.lock_file.close()
+
+    def refresh(self) -> None:
+        with self.replica_lock:
+            try:
+                self._catch_up_reading()
+            except CatalogStalled:
+                # Called in the background: the next call tries again.
+                return
+        if self._unlogged and self.journal is not None:
+            self._unlogged = False
+            self.journal.snapshot(self, force=True)
+
+    def catch_up(self) -> None:
+        """Apply the writes of other processes to the replica. Called under `replica_lock`."""
+        change = self.catalog.read(*self._seen)
+        if change is None:
+            return
+        seq, changes, rows, ids = change
+        # Store names as narrow as they are, not as wide as the catalog allows.
+        width = int(np.char.str_len(rows["names"]).max(initial=1))
+        rows["names"] = rows["names"].astype(f"S{width}")
+        if ids is None:
+            tables = build_tables(rows)
+            self._unlogged = self.journal is not None
+            # The changes in between are unknown; followers must re-read the items.
+            self._announce("reset")
+        else:
+            version = self._current
+            gone = np.setdiff1d(ids, rows["ids"])
+            for item_id in gone[version.contains_many(gone)].tolist():
+                version = StoreVersion(version.number, tuple(version.without(item_id)))
+                self._record("delete", id=item_id)
+                self._announce("delete", {"ids": np.array([item_id], dtype=np.int64)})
+            order = np.argsort(rows["ids"])
+            rows = {column: values[order] for column, values in rows.items()}
+            if len(order):
+                is_new = ~version.contains_many(rows["ids"])
+                tables = version.with_rows(rows)
+                self._record("put", rows=self._encode(rows))
+                for op, mask in (("add", is_new), ("update", ~is_new)):
+                    self._announce(
+                        op, {column: values[mask] for column, values in rows.items()}
+                    )
+            else:
+                tables = list(version.tables)
+        self._seen = (seq, changes)
+        self._publish(tables)
+
+    def repair(self) -> None:
+        """Recover from a writer that died mid-write. Called holding the lock file."""
+        if self.catalog.repair():
+            logger.warning(
+                "A worker stopped in the middle of a write to the shared catalog; "
+                "the items are read again in full."
+            )
+
+    def _catch_up_reading(self) -> None:
+        """Catch up outside of a write. Called under `replica_lock`.
+
+        If the catalog stays locked by a write, the lock file tells whether its
+        writer is still alive: if it can be taken, the write is repaired.
+        """
+        try:
+            self.catch_up()
+        except CatalogStalled:
+            # Under `replica_lock`, no other thread of this process holds it.
+            if not try_lock(self.lock_file):
+                raise
+            try:
+                self.repair()
+                self.catch_up()
+            finally:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def load(self, columns: Columns, names: list[str]) -> None:
+        width = max((len(name.encode()) for name in names), default=0)
+        self.catalog.check(width, len(columns["ids"]))
+        super().load(columns, names)
+        self.catalog.replace(self._current.columns())
+        self._mark_seen()
+
+    def _put(self, rows: Columns) -> None:
+        added = int((~self._current.contains_many(rows["ids"])).sum())
+        self.catalog.check(rows["names"].dtype.itemsize, self.catalog.rows + added)
+        super()._put(rows)
+        self.catalog.upsert(rows)
+        self._mark_seen()
+
+    def _patch(self, patch: dict[str, list]) -> None:
+        width = max(
+            (len(name.encode()) for name in patch["name"] if name is not None),
+            default=0,
+        )
+        self.catalog.check(width, self.catalog.rows)
+        super()._patch(patch)
+        self.catalog.upsert(self._current.rows(np.array(patch["ids"], dtype=np.int64)))
+        self._mark_seen()
+
+    def _remove(self, item_id: int) -> None:
+        super()._remove(item_id)
+        self.catalog.remove(np.array([item_id], dtype=np.int64))
+        self._mark_seen()
+
+    def _publish(self, tables: list[ItemTable]) -> None:
+        # Reading `current` here could start catching up again while catching up.
+        self._current = StoreVersion(self._current.number + 1, tuple(tables))
+
+    def _mark_seen(self) -> None:
+        """Note that the replica holds the write just made to the catalog."""
+        self._seen = (self.catalog.seq, self.catalog.changes)
+
+
+def try_lock(file) -> bool:
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
@@ -0,0 +1,78 @@
+import numpy as np
+
+# How the figures of disjoint sets of rows combine into those of their union.
+REDUCERS = {
+    "items": np.sum,
+    "units": np.sum,
+    "stock_value": np.sum,
+    "price_sum": np.sum,
+    "min_price": np.min,
+    "max_price": np.max,
+}
+
+
+class CategoryTotals:
+    """Inventory aggregates of some rows, with one entry per category code.
+
+    `units` is the sum of the counts and `stock_value` that of price * count.
+    `units` holds Python ints: a single count may be as large as int64 allows,
+    so their sum would overflow int64.
+    Categories without rows have a minimum price of +inf and a maximum of -inf.
+    """
+
+    def __init__(
+        self,
+        items: np.ndarray,
+        units: np.ndarray,
+        stock_value: np.ndarray,
+        price_sum: np.ndarray,
+        min_price: np.ndarray,
+        max_price: np.ndarray,
+    ):
+        self.items = items
+        self.units = units
+        self.stock_value = stock_value
+        self.price_sum = price_sum
+        self.min_price = min_price
+        self.max_price = max_price
+
+    @classmethod
+    def of(
+        cls,
+        categories: np.ndarray,
+        prices: np.ndarray,
+        counts: np.ndarray,
+        size: int,
+    ) -> "CategoryTotals":
+        """Compute the totals of rows whose category codes are below `size`."""
+        figures = {field: [] for field in REDUCERS}
+        for code in range(size):
+            mask = categories == code
+            category_prices, category_counts = prices[mask], counts[mask]
+            figures["items"].append(len(category_prices))
+            figures["units"].append(category_counts.sum(dtype=object))
+            figures["stock_value"].append((category_prices * category_counts).sum())
+            figures["price_sum"].append(category_prices.sum())
+            figures["min_price"].append(category_prices.min(initial=np.inf))
+            figures["max_price"].append(category_prices.max(initial=-np.inf))
+        return cls(
+            items=np.array(figures["items"], dtype=np.int64),
+            units=np.array(figures["units"], dtype=object),
+            stock_value=np.array(figures["stock_value"], dtype=np.float64),
+            price_sum=np.array(figures["price_sum"], dtype=np.float64),
+            min_price=np.array(figures["min_price"], dtype=np.float64),
+            max_price=np.array(figures["max_price"], dtype=np.float64),
+        )
+
+    @classmethod
+    def combine(cls, parts: list["CategoryTotals"], size: int) -> "CategoryTotals":
+        """Return the totals of the union of the disjoint rows `parts` were computed on."""
+        if not parts:
+            empty = np.empty(0)
+            return cls.of(empty.astype(np.int8), empty, empty.astype(np.int64), size)
+        return cls(
+            **{
+                field: reduce([getattr(part, field) for part in parts], axis=0)
+                for field, reduce in REDUCERS.items()
+            }
+        )
@@ -0,0 +1,803 @@
+import threading
+from bisect import bisect_right
+from collections.abc import Iterator
+
+import numpy as np
+from errors import (
+    CountOverflow,
+    InsufficientStock,
+    InvalidCursor,
+    ItemAlreadyExists,
+    ItemNotFound,
+    NoUpdateParameters,
+)
+from indexes import TableIndexes, bound
+from models import (
+    INT64_MAX,
+    Category,
+    CategoryStats,
+    Item,
+    ItemOrder,
+    ItemUpdate,
+    RowError,
+)
+from stats import CategoryTotals
+
+CATEGORIES = list(Category)
+CATEGORY_CODES = {category: code for code, category in enumerate(CATEGORIES)}
+
+# Upper bound for the rows of one table; a write copies at most this many rows.
+TABLE_SIZE = 4096
+
+COLUMNS = (
+    ("ids", np.int64),
+    ("prices", np.float64),
+    ("counts", np.int64),
+    ("categories", np.int8),
+    # UTF-8 encoded names; the width of the column is that of the longest name.
+    ("names", np.bytes_),
+)
+
+Columns = dict[str, np.ndarray]
+# New values of some columns, with a mask of the rows that change each of them.
+Changes = dict[str, tuple[np.ndarray, np.ndarray]]
+
+
+class ItemTable:
+    """An immutable, column-oriented block of items, with rows sorted by id.
+
+    Writes never modify a table: they build a new one holding the change.
+    """
+
+    def __init__(self, **columns: np.ndarray):
+        for name, _ in COLUMNS:
+            column = columns[name]
+            column.flags.writeable = False
+            setattr(self, name, column)
+        # Kept as plain ints: every new version reads them for all of its tables.
+        self.size = len(self.ids)
+        self.first_id = int(self.ids[0]) if self.size else None
+        self.indexes = TableIndexes(
+            self.categories, self.counts, self.prices, self.names
+        )
+        self._totals: CategoryTotals | None = None
+
+    @classmethod
+    def empty(cls) -> "ItemTable":
+        return cls(**{name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS})
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def totals(self) -> CategoryTotals:
+        """Aggregates per category, computed on first use.
+
+        A write rebuilds only the tables it changes, so it invalidates the totals
+        of at most a few TABLE_SIZE rows.
+        """
+        if self._totals is None:
+            self._totals = CategoryTotals.of(
+                self.categories, self.prices, self.counts, len(CATEGORIES)
+            )
+        return self._totals
+
+    def find(self, item_id: int) -> int | None:
+        position = int(np.searchsorted(self.ids, item_id))
+        if position < len(self.ids) and self.ids[position] == item_id:
+            return position
+        return None
+
+    def item(self, position: int) -> Item:
+        return Item.model_construct(
+            id=int(self.ids[position]),
+            name=self.names[position].decode(),
+            price=float(self.prices[position]),
+            count=int(self.counts[position]),
+            category=CATEGORIES[self.categories[position]],
+        )
+
+    def items(self, start: int = 0) -> Iterator[Item]:
+        """Yield the items from position `start` on, converting whole columns at once."""
+        rows = zip(
+            self.ids[start:].tolist(),
+            self.names[start:].tolist(),
+            self.prices[start:].tolist(),
+            self.counts[start:].tolist(),
+            self.categories[start:].tolist(),
+        )
+        for item_id, name, price, count, category in rows:
+            yield Item.model_construct(
+                id=item_id,
+                name=name.decode(),
+                price=price,
+                count=count,
+                category=CATEGORIES[category],
+            )
+
+    def with_rows(self, rows: Columns) -> "ItemTable":
+        """Return a copy of the table with `rows` inserted or replacing their ids.
+
+        `rows` holds one array per column, sorted by id without repeated ids.
+        """
+        positions = np.searchsorted(self.ids, rows["ids"])
+        exists = positions < len(self)
+        exists[exists] = self.ids[positions[exists]] == rows["ids"][exists]
+        columns = {}
+        for name, _ in COLUMNS:
+            column = getattr(self, name)
+            # Widened if needed, so that longer names are not truncated.
+            column = column.astype(np.result_type(column, rows[name]))
+            column[positions[exists]] = rows[name][exists]
+            columns[name] = np.insert(column, positions[~exists], rows[name][~exists])
+        return ItemTable(**columns)
+
+    def patched(self, ids: np.ndarray, changes: Changes) -> "ItemTable":
+        """Return a copy of the table with some columns of existing rows changed.
+
+        `changes` maps a column to its new values and a mask of the rows that set
+        it. Columns nobody changes are shared with this table instead of copied.
+        """
+        positions = np.searchsorted(self.ids, ids)
+        columns = {name: getattr(self, name) for name, _ in COLUMNS}
+        for name, (values, present) in changes.items():
+            if present.any():
+                column = columns[name]
+                column = column.astype(np.result_type(column, values))
+                column[positions[present]] = values[present]
+                columns[name] = column
+        return ItemTable(**columns)
+
+    def without(self, position: int) -> "ItemTable":
+        return ItemTable(
+            **{name: np.delete(getattr(self, name), position) for name, _ in COLUMNS}
+        )
+
+    def split(self) -> list["ItemTable"]:
+        """Split the table into pieces of similar size holding at most TABLE_SIZE rows."""
+        pieces = -(-len(self) // TABLE_SIZE)
+        if pieces <= 1:
+            return [self]
+        bounds = np.linspace(0, len(self), pieces + 1).astype(int).tolist()
+        return [
+            ItemTable(**{name: getattr(self, name)[start:end] for name, _ in COLUMNS})
+            for start, end in zip(bounds, bounds[1:])
+        ]
+
+    def select(
+        self,
+        name: bytes | None,
+        name_prefix: bytes | None,
+        price: float | None,
+        count: int | None,
+        category: Category | None,
+        min_price: float | None,
+        max_price: float | None,
+        min_count: int | None,
+        max_count: int | None,
+    ) -> np.ndarray:
+        """Return the positions of the rows matching every given filter, in order.
+
+        Equality and name filters narrow the candidates through the indexes
+        first; range filters are then applied as boolean masks over the columns.
+        `name` and `name_prefix` are lowercased and UTF-8 encoded.
+        """
+        positions = self.indexes.candidates(
+            price=price,
+            count=count,
+            category=None if category is None else CATEGORY_CODES[category],
+            name=name,
+            name_prefix=name_prefix,
+        )
+        if positions is None:
+            positions = np.arange(len(self))
+        mask = np.ones(len(positions), dtype=bool)
+        if min_price is not None:
+            mask &= self.prices[positions] >= min_price
+        if max_price is not None:
+            mask &= self.prices[positions] <= max_price
+        if min_count is not None:
+            mask &= self.counts[positions] >= min_count
+        if max_count is not None:
+            mask &= self.counts[positions] <= max_count
+        return positions[mask]
+
+    def ordered_by_price(
+        self,
+        positions: np.ndarray | None,
+        descending: bool,
+        after: tuple[float, int | None] | None,
+        limit: int | None,
+    ) -> np.ndarray:
+        """Order `positions` (all rows if None) by price, then id, and return up to
+        `limit` of them, starting after the `(price, id)` cursor `after`.
+
+        The price index holds the rows in that order, so the cursor is found by
+        binary search and a selection is picked out of the index from there on,
+        in growing chunks until `limit` rows are found.
+        """
+        index = self.indexes.index("price")
+        start, end = 0, len(self)
+        if after is not None:
+            price, item_id = after
+            # Compare positions instead of ids: they are in the same order.
+            if descending:
+                position = 0 if item_id is None else np.searchsorted(self.ids, item_id)
+                end = bound(index.values, index.order, price, position)
+            else:
+                position = (
+                    len(self)
+                    if item_id is None
+                    else np.searchsorted(self.ids, item_id, side="right")
+                )
+                start = bound(index.values, index.order, price, position)
+        window = index.order[start:end]
+        if descending:
+            window = window[::-1]
+        if positions is None:
+            return window[:limit]
+        selected = np.zeros(len(self), dtype=bool)
+        selected[positions] = True
+        if limit is None:
+            return window[selected[window]]
+        found, offset, chunk = [], 0, 2 * limit
+        while offset < len(window) and sum(map(len, found)) < limit:
+            part = window[offset : offset + chunk]
+            found.append(part[selected[part]])
+            offset += chunk
+            chunk *= 2
+        return np.concatenate(found)[:limit] if found else window[:0]
+
+
+def concatenate(parts: list[Columns]) -> Columns:
+    return {
+        name: (
+            np.concatenate([part[name] for part in parts])
+            if parts
+            else np.empty(0, dtype=dtype)
+        )
+        for name, dtype in COLUMNS
+    }
+
+
+def build_tables(columns: Columns) -> list[ItemTable]:
+    """Sort the rows of `columns` by id and split them into tables."""
+    order = np.argsort(columns["ids"], kind="stable")
+    columns = {
+        name: np.asarray(columns[name][order], dtype=dtype) for name, dtype in COLUMNS
+    }
+    return ItemTable(**columns).split() if len(order) else []
+
+
+class StoreVersion:
+    """An immutable version of the whole store.
+
+    The items are split into tables covering consecutive id ranges, and `bounds`
+    holds the lowest id of every table. A version is never modified once it is
+    published, so it can be read from any thread without locking.
+    """
+
+    def __init__(self, number: int, tables: tuple[ItemTable, ...]):
+        self.number = number
+        self.tables = tables
+        self.bounds = [table.first_id for table in tables]
+        self.size = sum([table.size for table in tables])
+        self._totals: CategoryTotals | None = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, item_id: int) -> bool:
+        return self.locate(item_id)[1] is not None
+
+    def __iter__(self) -> Iterator[Item]:
+        return self.items_after(None)
+
+    def items_after(self, after_id: int | None) -> Iterator[Item]:
+        """Yield the items with an id greater than `after_id` (all if None), in order."""
+        first, start = 0, 0
+        if after_id is not None and self.tables:
+            first = self.table_index(after_id)
+            start = int(np.searchsorted(self.tables[first].ids, after_id, side="right"))
+        for table in self.tables[first:]:
+            yield from table.items(start)
+            start = 0
+
+    def get(self, item_id: int) -> Item:
+        table, position = self.locate(item_id)
+        if position is None:
+            raise ItemNotFound(item_id)
+        return self.tables[table].item(position)
+
+    def locate(self, item_id: int) -> tuple[int, int | None]:
+        """Return the table that holds (or would hold) `item_id` and its position in it."""
+        table = self.table_index(item_id)
+        if not self.tables:
+            return table, None
+        return table, self.tables[table].find(item_id)
+
+    def table_index(self, item_id: int) -> int:
+        return max(bisect_right(self.bounds, item_id) - 1, 0)
+
+    def runs(self, ids: np.ndarray) -> list[tuple[int, slice]]:
+        """Split sorted `ids` into runs that belong to the same table."""
+        if not len(ids):
+            return []
+        if len(ids) == 1:
+            # Single-item writes skip the array arithmetic below.
+            return [(self.table_index(int(ids[0])), slice(0, 1))]
+        tables = (np.searchsorted(self.bounds, ids, side="right") - 1).clip(min=0)
+        starts = np.flatnonzero(np.r_[True, tables[1:] != tables[:-1]])
+        ends = np.r_[starts[1:], len(ids)]
+        return [
+            (int(tables[start]), slice(start, end))
+            for start, end in zip(starts.tolist(), ends.tolist())
+        ]
+
+    def contains_many(self, ids: np.ndarray) -> np.ndarray:
+        """Return a mask of the sorted `ids` that are in this version."""
+        found = np.zeros(len(ids), dtype=bool)
+        if not self.tables:
+            return found
+        for index, run in self.runs(ids):
+            table, chunk = self.tables[index], ids[run]
+            positions = np.searchsorted(table.ids, chunk).clip(max=len(table) - 1)
+            found[run] = table.ids[positions] == chunk
+        return found
+
+    def columns(self) -> Columns:
+        """Return the columns of all items, ordered by id."""
+        return concatenate(
+            [
+                {name: getattr(table, name) for name, _ in COLUMNS}
+                for table in self.tables
+            ]
+        )
+
+    def rows(self, ids: np.ndarray) -> Columns:
+        """Return the columns of the items with the sorted `ids`, which must exist."""
+        parts = []
+        for index, run in self.runs(ids):
+            table = self.tables[index]
+            positions = np.searchsorted(table.ids, ids[run])
+            parts.append({name: getattr(table, name)[positions] for name, _ in COLUMNS})
+        return concatenate(parts)
+
+    def with_rows(self, rows: Columns) -> list[ItemTable]:
+        """Return the tables with `rows` inserted or replaced, copying each affected
+        table once. `rows` is sorted by id, without repeated ids."""
+        tables = list(self.tables) or [ItemTable.empty()]
+        # Replace the tables from the last one backwards, so that splitting a
+        # table does not shift the indexes of the ones still to be replaced.
+        for index, run in reversed(self.runs(rows["ids"])):
+            chunk = {name: column[run] for name, column in rows.items()}
+            tables[index : index + 1] = tables[index].with_rows(chunk).split()
+        return tables
+
+    def without(self, item_id: int) -> list[ItemTable]:
+        """Return the tables without the item `item_id`."""
+        index, position = self.locate(item_id)
+        if position is None:
+            raise ItemNotFound(item_id)
+        tables = list(self.tables)
+        table = tables[index].without(position)
+        tables[index : index + 1] = [table] if len(table) else []
+        return tables
+
+    @property
+    def totals(self) -> CategoryTotals:
+        """Aggregates per category, added up from those of the tables once per version."""
+        if self._totals is None:
+            self._totals = CategoryTotals.combine(
+                [table.totals for table in self.tables], len(CATEGORIES)
+            )
+        return self._totals
+
+    def stats(self) -> dict[Category, CategoryStats]:
+        totals = self.totals
+        stats = {}
+        for code, category in enumerate(CATEGORIES):
+            items = int(totals.items[code])
+            stats[category] = CategoryStats(
+                items=items,
+                total_count=int(totals.units[code]),
+                stock_value=float(totals.stock_value[code]),
+                min_price=float(totals.min_price[code]) if items else None,
+                max_price=float(totals.max_price[code]) if items else None,
+                avg_price=float(totals.price_sum[code]) / items if items else None,
+            )
+        return stats
+
+    def select(
+        self,
+        name: str | None = None,
+        name_prefix: str | None = None,
+        price: float | None = None,
+        count: int | None = None,
+        category: Category | None = None,
+        min_price: float | None = None,
+        max_price: float | None = None,
+        min_count: int | None = None,
+        max_count: int | None = None,
+        order_by: ItemOrder = ItemOrder.ID,
+        top_k: int | None = None,
+        after_price: float | None = None,
+        after_id: int | None = None,
+    ) -> list[Item]:
+        """Return the first `top_k` (or all) items matching every given filter.
+
+        `name` matches names containing it and `name_prefix` names starting with
+        it, both ignoring case. Items ordered by id start after `after_id`; items
+        ordered by price start after `(after_price, after_id)` in that order, or
+        after every item priced `after_price` if `after_id` is None.
+        """
+        if order_by is ItemOrder.ID and after_price is not None:
+            raise InvalidCursor(order_by.value)
+        if (
+            order_by is not ItemOrder.ID
+            and after_price is None
+            and after_id is not None
+        ):
+            raise InvalidCursor(order_by.value)
+        filters = (
+            None if name is None else name.lower().encode(),
+            None if name_prefix is None else name_prefix.lower().encode(),
+            price,
+            count,
+            category,
+            min_price,
+            max_price,
+            min_count,
+            max_count,
+        )
+        if order_by is ItemOrder.ID:
+            return self._select_by_id(filters, top_k, after_id)
+        descending = order_by is ItemOrder.PRICE_DESCENDING
+        after = None if after_price is None else (after_price, after_id)
+        filtered = any(value is not None for value in filters)
+        # Every table contributes its first `top_k` rows in price order, which
+        # its price index gives without looking at the others.
+        parts = [
+            table.ordered_by_price(
+                table.select(*filters) if filtered else None,
+                descending,
+                after,
+                top_k,
+            )
+            for table in self.tables
+        ]
+        if not parts:
+            return []
+        tables = np.repeat(np.arange(len(parts)), [len(part) for part in parts])
+        positions = np.concatenate(parts)
+        prices = np.concatenate(
+            [table.prices[part] for table, part in zip(self.tables, parts)]
+        )
+        # Tables cover increasing id ranges, so the table index orders ties by id.
+        order = np.lexsort((positions, tables, prices))
+        if descending:
+            order = order[::-1]
+        order = order[:top_k]
+        return [
+            self.tables[table].item(position)
+            for table, position in zip(
+                tables[order].tolist(), positions[order].tolist()
+            )
+        ]
+
+    def _select_by_id(
+        self, filters: tuple, top_k: int | None, after_id: int | None
+    ) -> list[Item]:
+        selection = []
+        first = 0 if after_id is None else self.table_index(after_id)
+        for table in self.tables[first:]:
+            positions = table.select(*filters)
+            if after_id is not None:
+                positions = positions[table.ids[positions] > after_id]
+            if top_k is not None:
+                positions = positions[: top_k - len(selection)]
+            selection.extend(table.item(position) for position in positions)
+            if top_k is not None and len(selection) >= top_k:
+                break
+        return selection
+
+
+class ItemStore:
+    """Versioned, copy-on-write storage for items.
+
+    Readers use the `current` version and never lock. Writers are serialized by
+    `lock`: a write copies only the table it changes and then publishes a new
+    version with a single attribute assignment.
+    """
+
+    def __init__(self):
+        self.current = StoreVersion(0, ())
+        self.lock = threading.Lock()
+        self.journal = None
+        self.feed = None
+
+    def __len__(self) -> int:
+        return len(self.current)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self.current
+
+    def get(self, item_id: int) -> Item:
+        return self.current.get(item_id)
+
+    def select(self, **filters) -> list[Item]:
+        return self.current.select(**filters)
+
+    def stats(self) -> dict[Category, CategoryStats]:
+        return self.current.stats()
+
+    def refresh(self) -> None:
+        """Catch up with writes made outside this object; every write goes through
+        it here, so there is nothing to do."""
+
+    def add(self, item: Item) -> Item:
+        with self.lock:
+            if item.id in self.current:
+                raise ItemAlreadyExists(item.id)
+            rows = self._rows([item])
+            self._put(rows)
+            self._record("add", item=item.model_dump(mode="json"))
+            self._announce("add", rows)
+        return item
+
+    def update(
+        self,
+        item_id: int,
+        name: str | None = None,
+        price: float | None = None,
+        count: int | None = None,
+    ) -> Item:
+        with self.lock:
+            old = self.current.get(item_id)
+            new = old.model_copy(
+                update={
+                    "name": name or old.name,
+                    "price": price or old.price,
+                    "count": count or old.count,
+                }
+            )
+            rows = self._rows([new])
+            self._put(rows)
+            self._record("update", item=new.model_dump(mode="json"))
+            self._announce("update", rows)
+        return new
+
+    def reserve(self, item_id: int, quantity: int) -> Item:
+        """Take `quantity` instances of an item out of stock, if there are that many."""
+        # Refusing needs no lock: the published version is a consistent snapshot
+        # and a count only changes by a later version. Once an item sells out,
+        # the requests still coming in do not queue up for the write lock.
+        available = self.current.get(item_id).count
+        if available < quantity:
+            raise InsufficientStock(item_id, available, quantity)
+        return self._add_to_count(item_id, -quantity)
+
+    def release(self, item_id: int, quantity: int) -> Item:
+        """Put `quantity` reserved instances of an item back in stock."""
+        return self._add_to_count(item_id, quantity)
+
+    def delete(self, item_id: int) -> Item:
+        with self.lock:
+            item = self.current.get(item_id)
+            self._remove(item_id)
+            self._record("delete", id=item_id)
+            self._announce("delete", {"ids": np.array([item_id], dtype=np.int64)})
+        return item
+
+    def add_many(self, items: list[Item], atomic: bool = True) -> list[RowError]:
+        """Add many items in one write and return the rows that could not be added.
+
+        If `atomic` is set and any row fails, nothing is added.
+        """
+        with self.lock:
+            ids = np.array([item.id for item in items], dtype=np.int64)
+            order = np.argsort(ids, kind="stable")
+            ids = ids[order]
+            # Every occurrence of an id after the first one is rejected as well.
+            rejected = np.empty(len(ids), dtype=bool)
+            rejected[order] = np.r_[False, ids[1:] == ids[:-1]] | (
+                self.current.contains_many(ids)
+            )
+            errors = [
+                RowError(
+                    index=index,
+                    id=items[index].id,
+                    detail=ItemAlreadyExists(items[index].id).detail,
+                )
+                for index in np.flatnonzero(rejected).tolist()
+            ]
+            accepted = [items[index] for index in np.flatnonzero(~rejected).tolist()]
+            if accepted and not (atomic and errors):
+                rows = self._rows(accepted)
+                self._put(rows)
+                self._record("put", rows=self._encode(rows))
+                self._announce("add", rows)
+        return errors
+
+    def update_many(
+        self, updates: list[ItemUpdate], atomic: bool = True
+    ) -> list[RowError]:
+        """Apply many partial updates in one write and return the rows that failed.
+
+        Updates are applied in order, so for repeated ids the last value given for
+        a field wins. If `atomic` is set and any row fails, nothing is updated.
+        """
+        with self.lock:
+            errors = []
+            changes: dict[int, dict[str, str | float | int]] = {}
+            indexes: dict[int, list[int]] = {}
+            for index, update in enumerate(updates):
+                fields = {
+                    field: value
+                    for field in ("name", "price", "count")
+                    if (value := getattr(update, field)) is not None
+                }
+                if not fields:
+                    errors.append(
+                        RowError(
+                            index=index,
+                            id=update.id,
+                            detail=NoUpdateParameters().detail,
+                        )
+                    )
+                    continue
+                changes.setdefault(update.id, {}).update(fields)
+                indexes.setdefault(update.id, []).append(index)
+
+            ids = np.array(sorted(changes), dtype=np.int64)
+            for item_id in ids[~self.current.contains_many(ids)].tolist():
+                detail = ItemNotFound(item_id).detail
+                errors.extend(
+                    RowError(index=index, id=item_id, detail=detail)
+                    for index in indexes[item_id]
+                )
+                del changes[item_id]
+            errors.sort(key=lambda error: error.index)
+
+            if changes and not (atomic and errors):
+                patch = {"ids": sorted(changes)}
+                for field in ("name", "price", "count"):
+                    patch[field] = [
+                        changes[item_id].get(field) for item_id in patch["ids"]
+                    ]
+                self._patch(patch)
+                self._record("patch", patch=patch)
+                ids = np.array(patch["ids"], dtype=np.int64)
+                self._announce("update", self.current.rows(ids))
+        return errors
+
+    def apply(self, record: dict) -> None:
+        """Apply a mutation read back from the journal while recovering."""
+        match record["op"]:
+            case "add" | "update":
+                self._put(self._rows([Item.model_validate(record["item"])]))
+            case "put":
+                self._put(self._decode(record["rows"]))
+            case "patch":
+                self._patch(record["patch"])
+            case "delete":
+                self._remove(record["id"])
+
+    def export(self, version: StoreVersion) -> tuple[dict[str, np.ndarray], list[str]]:
+        """Return the columns of `version` and the names they reference, compacted."""
+        columns = version.columns()
+        # Names are written once each, referenced by their position in the list.
+        used, codes = np.unique(columns["names"], return_inverse=True)
+        columns["names"] = codes.astype(np.int32)
+        return columns, [name.decode() for name in used.tolist()]
+
+    def load(self, columns: dict[str, np.ndarray], names: list[str]) -> None:
+        """Replace the contents of the store with exported columns."""
+        encoded = np.array([name.encode() for name in names], dtype=np.bytes_)
+        columns = {
+            **columns,
+            "names": encoded[np.asarray(columns["names"], dtype=np.intp)],
+        }
+        self._publish(build_tables(columns))
+
+    def _add_to_count(self, item_id: int, delta: int) -> Item:
+        with self.lock:
+            item = self.current.get(item_id)
+            if item.count + delta < 0:
+                raise InsufficientStock(item_id, item.count, -delta)
+            # Counts are stored as int64.
+            if item.count + delta > INT64_MAX:
+                raise CountOverflow(item_id, item.count, delta, INT64_MAX)
+            item = item.model_copy(update={"count": item.count + delta})
+            patch = {
+                "ids": [item_id],
+                "name": [None],
+                "price": [None],
+                "count": [item.count],
+            }
+            self._patch(patch)
+            self._record("patch", patch=patch)
+            self._announce("update", self._rows([item]))
+        return item
+
+    def _record(self, op: str, **fields) -> None:
+        if self.journal is not None:
+            self.journal.record(op, **fields)
+
+    def _announce(self, op: str, rows: Columns | None = None) -> None:
+        """Publish the rows a write changed to the change feed, if there is one."""
+        if self.feed is not None:
+            self.feed.publish(op, rows)
+
+    def _rows(self, items: list[Item]) -> Columns:
+        """Return the columns of `items`, sorted by id; for repeated ids the last wins."""
+        batch = sorted(
+            {item.id: item for item in items}.values(), key=lambda item: item.id
+        )
+        return {
+            "ids": np.array([item.id for item in batch], dtype=np.int64),
+            "prices": np.array([item.price for item in batch], dtype=np.float64),
+            "counts": np.array([item.count for item in batch], dtype=np.int64),
+            "categories": np.array(
+                [CATEGORY_CODES[item.category] for item in batch], dtype=np.int8
+            ),
+            "names": np.array([item.name.encode() for item in batch], dtype=np.bytes_),
+        }
+
+    def _encode(self, rows: Columns) -> dict[str, list]:
+        """Turn rows into JSON-friendly lists, with names and categories spelled out."""
+        return {
+            "ids": rows["ids"].tolist(),
+            "prices": rows["prices"].tolist(),
+            "counts": rows["counts"].tolist(),
+            "categories": [
+                CATEGORIES[code].value for code in rows["categories"].tolist()
+            ],
+            "names": [name.decode() for name in rows["names"].tolist()],
+        }
+
+    def _decode(self, data: dict[str, list]) -> Columns:
+        return {
+            "ids": np.array(data["ids"], dtype=np.int64),
+            "prices": np.array(data["prices"], dtype=np.float64),
+            "counts": np.array(data["counts"], dtype=np.int64),
+            "categories": np.array(
+                [CATEGORY_CODES[Category(value)] for value in data["categories"]],
+                dtype=np.int8,
+            ),
+            "names": np.array(
+                [name.encode() for name in data["names"]], dtype=np.bytes_
+            ),
+        }
+
+    def _put(self, rows: Columns) -> None:
+        self._publish(self.current.with_rows(rows))
+
+    def _patch(self, patch: dict[str, list]) -> None:
+        """Change some fields of existing items, given as lists where None means unchanged."""
+        version = self.current
+        ids = np.array(patch["ids"], dtype=np.int64)
+        changes = {}
+        for column, field, dtype, encode in (
+            ("names", "name", np.bytes_, str.encode),
+            ("prices", "price", np.float64, float),
+            ("counts", "count", np.int64, int),
+        ):
+            values = patch[field]
+            present = np.array([value is not None for value in values], dtype=bool)
+            encoded = [dtype() if value is None else encode(value) for value in values]
+            changes[column] = (np.array(encoded, dtype=dtype), present)
+        tables = list(version.tables)
+        for index, run in version.runs(ids):
+            table_changes = {
+                column: (values[run], present[run])
+                for column, (values, present) in changes.items()
+            }
+            tables[index] = tables[index].patched(ids[run], table_changes)
+        self._publish(tables)
+
+    def _remove(self, item_id: int) -> None:
+        self._publish(self.current.without(item_id))
+
+    def _publish(self, tables: list[ItemTable]) -> None:
+        self.current = StoreVersion(self.current.number + 1, tuple(tables))
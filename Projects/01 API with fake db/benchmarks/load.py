@@ -0,0 +1,414 @@
+"""Measure the latency and throughput of every endpoint of the Items API.
+
+The store is seeded with a number of items, then every endpoint is called in turn
+and its p50/p95/p99 latency, throughput and the peak RSS so far are reported as
+JSON. Run from the project directory:
+
+    python benchmarks/load.py --items 10000 100000 1000000
+    python benchmarks/load.py --items 100000 --mode uvicorn --workers 4
+
+In the default `asgi` mode the app runs in this process, driven through an
+in-process ASGI client, so the figures leave out the network and the server. In
+`uvicorn` mode a real server is started and called over HTTP; RSS is then read
+from `/proc`, so that mode only reports it on Linux. With more than one worker
+the items are shared between them, see "Multiple Workers" in the README.
+
+Every catalog size runs in a fresh process, with its data in a temporary
+directory.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+CATEGORIES = ("tools", "consumables")
+# Generated items get ids from here on, clear of the sample items.
+FIRST_ID = 1000
+SEED_BATCH = 10_000
+BULK_SIZE = 100
+
+
+@dataclass
+class Endpoint:
+    name: str
+    method: str
+    # Returns the URL and the request arguments of the i-th call.
+    request: Callable[[int], tuple[str, dict]]
+    # Endpoints returning the whole catalog are called fewer times.
+    heavy: bool = False
+    # Returns the method, URL and arguments of a request sent, untimed, before the
+    # i-th call.
+    before: Callable[[int], tuple[str, str, dict]] | None = None
+
+
+def make_item(item_id: int) -> dict:
+    return {
+        "id": item_id,
+        "name": f"item{item_id}",
+        "price": 0.5 + item_id % 1000 / 4,
+        "count": 1 + item_id % 100,
+        "category": CATEGORIES[item_id % len(CATEGORIES)],
+    }
+
+
+def endpoints(items: int, etag: str) -> list[Endpoint]:
+    """The calls to measure, in order; the ones removing items come last."""
+    last_id = FIRST_ID + items - 1
+    new_id = last_id + 1
+    rng = np.random.default_rng(0)
+    random_ids = (FIRST_ID + rng.integers(0, items, 100_000)).tolist()
+
+    def random_id(i: int) -> int:
+        return random_ids[i % len(random_ids)]
+
+    def new_items(i: int) -> list[dict]:
+        start = new_id + 1_000_000 + i * BULK_SIZE
+        return [make_item(item_id) for item_id in range(start, start + BULK_SIZE)]
+
+    return [
+        Endpoint("GET /", "GET", lambda i: ("/", {})),
+        Endpoint("GET /items/all", "GET", lambda i: ("/items/all", {}), heavy=True),
+        Endpoint(
+            "GET /items/all (If-None-Match)",
+            "GET",
+            lambda i: ("/items/all", {"headers": {"If-None-Match": etag}}),
+        ),
+        Endpoint(
+            "GET /items/all (NDJSON)",
+            "GET",
+            lambda i: ("/items/all", {"headers": {"Accept": "application/x-ndjson"}}),
+            heavy=True,
+        ),
+        Endpoint(
+            "GET /items/all?after_id&limit=100",
+            "GET",
+            lambda i: (
+                "/items/all",
+                {"params": {"after_id": random_id(i), "limit": 100}},
+            ),
+        ),
+        Endpoint("GET /items/{id}", "GET", lambda i: (f"/items/{random_id(i)}", {})),
+        Endpoint(
+            "GET /items/?name",
+            "GET",
+            lambda i: ("/items/", {"params": {"name": f"m{random_id(i)}"}}),
+        ),
+        Endpoint(
+            "GET /items/?name_prefix",
+            "GET",
+            lambda i: ("/items/", {"params": {"name_prefix": f"item{random_id(i)}"}}),
+        ),
+        Endpoint(
+            "GET /items/?price&category",
+            "GET",
+            lambda i: (
+                "/items/",
+                {"params": {"price": 0.5 + i % 1000 / 4, "category": "tools"}},
+            ),
+        ),
+        Endpoint(
+            "GET /items/?min_price&max_price",
+            "GET",
+            lambda i: (
+                "/items/",
+                {"params": {"min_price": i % 250, "max_price": i % 250 + 0.25}},
+            ),
+        ),
+        Endpoint(
+            "GET /items/?order_by=price&top_k=10",
+            "GET",
+            lambda i: ("/items/", {"params": {"order_by": "price", "top_k": 10}}),
+        ),
+        Endpoint(
+            "GET /items/?category&order_by=-price&top_k=10&after_price",
+            "GET",
+            lambda i: (
+                "/items/",
+                {
+                    "params": {
+                        "category": "tools",
+                        "order_by": "-price",
+                        "top_k": 10,
+                        "after_price": i % 250,
+                    }
+                },
+            ),
+        ),
+        Endpoint("GET /items/stats", "GET", lambda i: ("/items/stats", {})),
+        # A write drops the totals of the table it changes, which the next call
+        # computes again.
+        Endpoint(
+            "GET /items/stats (after a write)",
+            "GET",
+            lambda i: ("/items/stats", {}),
+            before=lambda i: (
+                "PUT",
+                f"/items/{random_id(i)}",
+                {"params": {"price": 1 + i % 9}},
+            ),
+        ),
+        Endpoint(
+            "POST /items/",
+            "POST",
+            lambda i: ("/items/", {"json": make_item(new_id + i)}),
+        ),
+        Endpoint(
+            "POST /items/bulk",
+            "POST",
+            lambda i: ("/items/bulk", {"json": new_items(i)}),
+        ),
+        Endpoint(
+            "PATCH /items/bulk",
+            "PATCH",
+            lambda i: (
+                "/items/bulk",
+                {
+                    "json": [
+                        {"id": random_id(i * BULK_SIZE + k), "count": 1 + i % 50}
+                        for k in range(BULK_SIZE)
+                    ]
+                },
+            ),
+        ),
+        Endpoint(
+            "PUT /items/{id}",
+            "PUT",
+            lambda i: (f"/items/{random_id(i)}", {"params": {"price": 1 + i % 9}}),
+        ),
+        # Every id is released as often as it is reserved, so stock never runs out.
+        Endpoint(
+            "POST /items/{id}/release",
+            "POST",
+            lambda i: (f"/items/{random_id(i)}/release", {}),
+        ),
+        Endpoint(
+            "POST /items/{id}/reserve",
+            "POST",
+            lambda i: (f"/items/{random_id(i)}/reserve", {}),
+        ),
+        Endpoint(
+            "DELETE /items/{id}", "DELETE", lambda i: (f"/items/{last_id - i}", {})
+        ),
+    ]
+
+
+def peak_rss_mb(server_pids: list[int] | None) -> float | None:
+    """The peak RSS of this process, or the largest one of the server processes."""
+    if server_pids is None:
+        # Kilobytes on Linux, bytes on macOS.
+        scale = 1 if sys.platform == "darwin" else 1024
+        return round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20, 1
+        )
+    peaks = []
+    for pid in server_pids:
+        try:
+            status = Path(f"/proc/{pid}/status").read_text()
+        except OSError:
+            continue
+        for line in status.splitlines():
+            if line.startswith("VmHWM:"):
+                peaks.append(round(int(line.split()[1]) / 1024, 1))
+    return max(peaks, default=None)
+
+
+async def measure(
+    client: httpx.AsyncClient,
+    endpoint: Endpoint,
+    requests: int,
+    concurrency: int,
+    server_pids: list[int] | None,
+) -> dict:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(i: int) -> None:
+        url, kwargs = endpoint.request(i)
+        async with semaphore:
+            if endpoint.before is not None:
+                method, before_url, before_kwargs = endpoint.before(i)
+                response = await client.request(method, before_url, **before_kwargs)
+                response.raise_for_status()
+            started = time.perf_counter()
+            response = await client.request(endpoint.method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f"{endpoint.name}: {response.status_code} {response.text}"
+            )
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        "endpoint": endpoint.name,
+        "requests": requests,
+        "p50_ms": round(p50, 3),
+        "p95_ms": round(p95, 3),
+        "p99_ms": round(p99, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "peak_rss_mb": peak_rss_mb(server_pids),
+    }
+
+
+async def seed(client: httpx.AsyncClient, items: int) -> None:
+    for start in range(FIRST_ID, FIRST_ID + items, SEED_BATCH):
+        end = min(start + SEED_BATCH, FIRST_ID + items)
+        batch = [make_item(item_id) for item_id in range(start, end)]
+        response = await client.post("/items/bulk", json=batch)
+        response.raise_for_status()
+
+
+async def run(
+    client: httpx.AsyncClient, args: argparse.Namespace, server_pids: list[int] | None
+) -> dict:
+    started = time.perf_counter()
+    await seed(client, args.items[0])
+    seeded = time.perf_counter() - started
+    etag = (await client.get("/items/all")).headers["ETag"]
+    results = []
+    for endpoint in endpoints(args.items[0], etag):
+        requests = args.heavy_requests if endpoint.heavy else args.requests
+        results.append(
+            await measure(client, endpoint, requests, args.concurrency, server_pids)
+        )
+    return {
+        "mode": args.mode,
+        "items": args.items[0],
+        "workers": args.workers if args.mode == "uvicorn" else None,
+        "concurrency": args.concurrency,
+        "seed_seconds": round(seeded, 3),
+        "endpoints": results,
+    }
+
+
+async def run_in_process(args: argparse.Namespace) -> dict:
+    sys.path.insert(0, str(APP_DIR))
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            return await run(client, args, None)
+
+
+async def run_with_uvicorn(args: argparse.Namespace) -> dict:
+    command = [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "main:app",
+        "--port",
+        str(args.port),
+        "--workers",
+        str(args.workers),
+        "--log-level",
+        "warning",
+    ]
+    env = dict(os.environ)
+    if args.workers > 1:
+        # Without it every worker would keep its own items.
+        env["SHARED_MEMORY_NAME"] = f"items-load-{os.getpid()}"
+        env["SHARED_CAPACITY"] = str(
+            args.items[0] + (args.requests + args.heavy_requests) * (BULK_SIZE + 1)
+        )
+    server = subprocess.Popen(command, cwd=APP_DIR, env=env)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            return await run(client, args, server_pids(server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def server_pids(pid: int) -> list[int]:
+    """The server process and its workers."""
+    children = Path(f"/proc/{pid}/task/{pid}/children")
+    if not children.exists():
+        return [pid]
+    return [pid, *map(int, children.read_text().split())]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[10_000])
+    parser.add_argument(
+        "--requests", type=int, default=200, help="Calls of every endpoint."
+    )
+    parser.add_argument(
+        "--heavy-requests",
+        type=int,
+        default=5,
+        help="Calls of the endpoints returning the whole catalog.",
+    )
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--mode", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--output", type=Path, help="Write the JSON here.")
+    args = parser.parse_args()
+
+    if len(args.items) > 1:
+        # Run every size in a fresh process, so sizes do not share state or RSS.
+        runs = []
+        for items in args.items:
+            output = subprocess.run(
+                [sys.executable, __file__, *single_size_args(items)],
+                check=True,
+                stdout=subprocess.PIPE,
+                text=True,
+            ).stdout
+            runs.extend(json.loads(output))
+    else:
+        with tempfile.TemporaryDirectory() as data_dir:
+            os.environ["DATA_DIR"] = data_dir
+            os.environ["SNAPSHOT_INTERVAL"] = "3600"
+            if args.mode == "asgi":
+                runs = [asyncio.run(run_in_process(args))]
+            else:
+                runs = [asyncio.run(run_with_uvicorn(args))]
+
+    report = json.dumps(runs, indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        args.output.write_text(report + "\n")
+
+
+def single_size_args(items: int) -> list[str]:
+    """The command line arguments, for a single catalog size and without output."""
+    args, skip = [], False
+    for arg in sys.argv[1:]:
+        if skip and not arg.startswith("--"):
+            continue
+        skip = arg in ("--items", "--output")
+        if not skip:
+            args.append(arg)
+    return [*args, "--items", str(items)]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Measure the memory used per item by the item store.
+
+Compares the store with a dict of `Item` models, which is how the items used to
+be kept, and with the secondary indexes built. Run from the project directory:
+
+    python benchmarks/memory.py --items 1000000
+
+Allocations are counted with `tracemalloc`, which also sees the NumPy arrays, so
+the run takes a while for large catalogs.
+"""
+
+import argparse
+import gc
+import sys
+import tracemalloc
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from models import Category, Item  # noqa: E402
+from store import ItemStore  # noqa: E402
+
+CATEGORIES = list(Category)
+
+
+def generate_items(count: int, distinct_names: int) -> Iterator[Item]:
+    for item_id in range(count):
+        yield Item(
+            id=item_id,
+            name=f"item{item_id % distinct_names}",
+            price=0.5 + item_id % 1000 / 4,
+            count=item_id % 100,
+            category=CATEGORIES[item_id % len(CATEGORIES)],
+        )
+
+
+def allocated(build: Callable[[], object]) -> tuple[object, int]:
+    """Return what `build` returns and the bytes it left allocated."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def build_store(count: int, distinct_names: int) -> ItemStore:
+    store = ItemStore()
+    store.add_many(list(generate_items(count, distinct_names)))
+    return store
+
+
+def build_indexes(store: ItemStore) -> None:
+    for table in store.current.tables:
+        table.indexes.candidates(price=0.0, count=0, category=0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument(
+        "--distinct-names",
+        type=int,
+        help="Number of different names (default: every item has its own).",
+    )
+    args = parser.parse_args()
+    count = args.items
+    distinct_names = args.distinct_names or count
+
+    models, models_size = allocated(
+        lambda: {item.id: item for item in generate_items(count, distinct_names)}
+    )
+    del models
+    store, store_size = allocated(lambda: build_store(count, distinct_names))
+    _, indexes_size = allocated(lambda: build_indexes(store))
+
+    print(f"{count} items, {distinct_names} distinct names")
+    print(f"{'dict of Item models':<24}{models_size / count:>10.1f} bytes/item")
+    print(f"{'ItemStore':<24}{store_size / count:>10.1f} bytes/item")
+    print(f"{'  + built indexes':<24}{indexes_size / count:>10.1f} bytes/item")
+    print(f"{'reduction':<24}{models_size / store_size:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
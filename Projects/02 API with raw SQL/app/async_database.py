@@ -0,0 +1,63 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import aiosqlite
+import anyio
+from database import DATABASE_PATH, EXPORT_POOL_SIZE, POOL_SIZE
+from metrics import TimedConnection
+
+
+class AsyncConnectionPool:
+    """aiosqlite connections, each lent to one request at a time.
+
+    Every aiosqlite connection runs its queries on a thread of its own, so the
+    requests waiting for the database hold no thread of FastAPI's threadpool: at
+    most `size` of them query at once, while the others wait on the event loop.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self._slots = asyncio.Semaphore(size)
+        # Last in, first out: the connections in use stay warm.
+        self._idle: list[aiosqlite.Connection] = []
+        self._opened: list[aiosqlite.Connection] = []
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else await self._connect()
+            try:
+                yield conn
+            finally:
+                # Even when the request is cancelled, as on a client leaving a
+                # stream, the connection goes back clean.
+                with anyio.CancelScope(shield=True):
+                    if conn.in_transaction:
+                        await conn.rollback()
+                self._idle.append(conn)
+
+    async def close(self) -> None:
+        for conn in self._opened:
+            await conn.close()
+        self._opened.clear()
+        self._idle.clear()
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.path, factory=TimedConnection)
+        self._opened.append(conn)
+        return conn
+
+
+pool = AsyncConnectionPool(DATABASE_PATH, POOL_SIZE)
+export_pool = AsyncConnectionPool(DATABASE_PATH, EXPORT_POOL_SIZE)
+
+
+# Dependency
+async def get_cursor() -> AsyncIterator[aiosqlite.Cursor]:
+    async with pool.connection() as conn:
+        cursor = await conn.cursor()
+        try:
+            yield cursor
+        finally:
+            await cursor.close()
@@ -0,0 +1,158 @@
+import json
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import anyio
+import queries
+from aiosqlite import Cursor
+from async_database import export_pool, get_cursor, pool
+from bulk import import_posts
+from config import settings
+from database import init_db, writer
+from etags import etag, if_match_version
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, status
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from metrics import metrics_response, time_request
+from models import INT64_MAX, Post, UpdatePost
+
+# The rows read from the cursor, encoded and sent together when streaming.
+STREAM_BATCH_SIZE = 500
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await anyio.to_thread.run_sync(init_db)
+    writer.start()
+    yield
+    writer.close()
+    await pool.close()
+    await export_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(time_request)
+
+
+def json_response(body: str, headers: dict[str, str] | None = None) -> Response:
+    """Send JSON rendered by SQLite as it is."""
+    return Response(body, headers=headers, media_type="application/json")
+
+
+@app.get("/")
+async def index():
+    content = """
+    <h1>Welcome to my API</h1>
+    <p>Please check the <a href="http://127.0.0.1:8000/docs">documentation</a> page.</p>
+    """
+    return HTMLResponse(content)
+
+
+@app.get("/metrics")
+async def read_metrics():
+    return metrics_response()
+
+
+@app.post("/posts", status_code=status.HTTP_201_CREATED)
+async def create_post(post: Post, response: Response):
+    new_post = await writer.apply(queries.insert_post(post))
+    response.headers["ETag"] = etag(new_post[3])
+    return {"post_detail": new_post}
+
+
+@app.post("/posts/bulk", status_code=status.HTTP_201_CREATED)
+async def create_posts(request: Request):
+    return await import_posts(request)
+
+
+@app.get("/posts")
+async def read_posts(
+    after_id: int = Query(0, ge=0, le=INT64_MAX),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Cursor = Depends(get_cursor),
+):
+    page = {"after_id": after_id, "limit": limit}
+    if settings.render_json_in_sqlite:
+        await cursor.execute(queries.PAGE_JSON, page)
+        (body,) = await cursor.fetchone()
+        return json_response(body)
+    await cursor.execute(queries.PAGE, page)
+    posts = await cursor.fetchall()
+    next_after_id = posts[-1][0] if len(posts) == limit else None
+    return {"posts": posts, "next_after_id": next_after_id}
+
+
+async def stream_posts(after_id: int) -> AsyncIterator[bytes]:
+    """Yield the posts after `after_id` as JSON lines, a batch of rows at a time.
+
+    The connection is held until the last batch is sent, so the posts are read
+    from a single snapshot of the table. It comes from the pool of the streams.
+    """
+    async with export_pool.connection() as conn:
+        cursor = await conn.execute(queries.ALL_AFTER, (after_id,))
+        try:
+            while posts := await cursor.fetchmany(STREAM_BATCH_SIZE):
+                yield "".join(json.dumps(post) + "\n" for post in posts).encode()
+        finally:
+            with anyio.CancelScope(shield=True):
+                await cursor.close()
+
+
+@app.get("/posts/stream")
+async def export_posts(after_id: int = Query(0, ge=0, le=INT64_MAX)):
+    return StreamingResponse(stream_posts(after_id), media_type="application/x-ndjson")
+
+
+@app.get("/posts/search")
+async def search_posts(
+    q: str = Query(min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    cursor: Cursor = Depends(get_cursor),
+):
+    query = queries.match_all_terms(q)
+    if not query:
+        return {"posts": []}
+    await cursor.execute(queries.SEARCH, (query, limit, offset))
+    posts = await cursor.fetchall()
+    return {"posts": posts}
+
+
+@app.get("/posts/{post_id}")
+async def read_post(
+    post_id: int, response: Response, cursor: Cursor = Depends(get_cursor)
+):
+    if settings.render_json_in_sqlite:
+        await cursor.execute(queries.POST_JSON, (post_id,))
+    else:
+        await cursor.execute(queries.POST, (post_id,))
+    post = await cursor.fetchone()
+    if not post:
+        raise HTTPException(status_code=404, detail=f"No post with {post_id=} found!")
+    if settings.render_json_in_sqlite:
+        body, version = post
+        return json_response(body, headers={"ETag": etag(version)})
+    response.headers["ETag"] = etag(post[3])
+    return {"post_detail": post}
+
+
+@app.put("/posts/{post_id}", status_code=status.HTTP_202_ACCEPTED)
+async def update_post(
+    post_id: int,
+    post: UpdatePost,
+    response: Response,
+    if_match: str | None = Header(None),
+):
+    version = if_match_version(post_id, if_match)
+    updated_post = await writer.apply(queries.update_post(post_id, post, version))
+    if not updated_post:
+        raise HTTPException(status_code=404, detail=f"No post with {post_id=} found!")
+    response.headers["ETag"] = etag(updated_post[3])
+    return {"updated_post_detail": updated_post}
+
+
+@app.delete("/posts/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_post(post_id: int, if_match: str | None = Header(None)):
+    version = if_match_version(post_id, if_match)
+    post = await writer.apply(queries.delete_post(post_id, version))
+    if not post:
+        raise HTTPException(status_code=404, detail=f"No post with {post_id=} found!")
@@ -0,0 +1,109 @@
+import asyncio
+from collections.abc import AsyncIterator, Awaitable
+
+from database import writer
+from fastapi import HTTPException, Request, status
+from models import Post
+from pydantic import TypeAdapter, ValidationError
+from queries import insert_posts
+
+# The posts inserted together, in one transaction.
+BULK_BATCH_SIZE = 10_000
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl")
+
+posts_adapter = TypeAdapter(list[Post])
+
+
+class InvalidPost(Exception):
+    def __init__(self, position: int, error: ValidationError):
+        self.position = position
+        self.error = error
+
+
+async def ndjson_posts(request: Request) -> AsyncIterator[Post]:
+    """Parse the posts of a body with a JSON object per line, as it is received."""
+    pending = b""
+    position = 0
+    async for chunk in request.stream():
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield parse_post(line, position)
+                position += 1
+    if pending.strip():
+        yield parse_post(pending, position)
+
+
+def parse_post(line: bytes, position: int) -> Post:
+    try:
+        return Post.model_validate_json(line)
+    except ValidationError as error:
+        raise InvalidPost(position, error)
+
+
+async def json_array_posts(request: Request) -> AsyncIterator[Post]:
+    """Parse the posts of a body holding a JSON array of them, once received."""
+    try:
+        posts = posts_adapter.validate_json(await request.body())
+    except ValidationError as error:
+        # The index of the first invalid post, or 0 if the JSON itself is.
+        location = error.errors()[0]["loc"]
+        raise InvalidPost(location[0] if location else 0, error)
+    for post in posts:
+        yield post
+
+
+async def import_posts(request: Request) -> dict:
+    """Insert the posts of the request body, a batch at a time.
+
+    The body is newline-delimited JSON when sent as such, a JSON array
+    otherwise. While a batch is committed by the writer, the next one is read.
+    Returns the number of posts inserted and the ranges of ids given to them,
+    a single one unless other posts were created during the import.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(NDJSON_TYPES):
+        posts = ndjson_posts(request)
+    else:
+        posts = json_array_posts(request)
+    imported = {"inserted": 0, "id_ranges": []}
+    committing = None
+    batch = []
+    try:
+        async for post in posts:
+            batch.append((post.title, post.content))
+            if len(batch) == BULK_BATCH_SIZE:
+                await record(imported, committing)
+                committing = asyncio.ensure_future(writer.apply(insert_posts(batch)))
+                batch = []
+    except InvalidPost as invalid:
+        await record(imported, committing)
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={
+                "message": f"Post {invalid.position} is invalid.",
+                "errors": invalid.error.errors(
+                    include_url=False, include_context=False, include_input=False
+                ),
+                # The batches committed before it are kept.
+                **imported,
+            },
+        )
+    await record(imported, committing)
+    if batch:
+        await record(imported, writer.apply(insert_posts(batch)))
+    return imported
+
+
+async def record(imported: dict, committing: Awaitable | None) -> None:
+    """Add the ids of a committed batch to the import, merging adjacent ranges."""
+    if committing is None:
+        return
+    first_id, last_id = await committing
+    imported["inserted"] += last_id - first_id + 1
+    ranges = imported["id_ranges"]
+    if ranges and ranges[-1][1] + 1 == first_id:
+        ranges[-1][1] = last_id
+    else:
+        ranges.append([first_id, last_id])
@@ -0,0 +1,18 @@
+from pathlib import Path
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    # Seconds between the refreshes of the read-only copy of the database, which
+    # is only kept when set.
+    replica_interval: float | None = None
+    replica_dir: Path = Path("replicas")
+    # Whether SQLite writes the JSON of the posts read, rather than the routes
+    # encoding the rows it returns.
+    render_json_in_sqlite: bool = True
+
+    model_config = SettingsConfigDict(env_file=".env")
+
+
+settings = Settings()
@@ -1,17 +1,205 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, closing
 from sqlite3 import Connection, Cursor
 
+from metrics import TimedConnection
+from writer import GroupCommitWriter
+
+DATABASE_PATH = "db.sqlite"
+# The default number of threads FastAPI runs sync routes and dependencies on.
+POOL_SIZE = 40
+# Streams hold a connection until their last row is sent, so they get their own
+# connections and cannot take all of those the other requests need.
+EXPORT_POOL_SIZE = 4
+
+
+class ConnectionPool:
+    """SQLite connections, each lent to one request at a time.
+
+    FastAPI may run the setup of a dependency, the route and the teardown of the
+    dependency on different threads of its threadpool, so a connection is not
+    tied to a thread; it is checked out for the whole request instead. Readers
+    on different connections run in parallel, while SQLite's file locks keep
+    the writers apart.
+
+    Requests wait for a connection on the event loop. Were they to wait on a
+    thread of the threadpool, once all the threads waited, the requests holding
+    the connections would have none left to run on and give them back.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self._slots = asyncio.Semaphore(size)
+        # Last in, first out: the connections in use stay warm.
+        self._idle: list[Connection] = []
+        self._closed = False
+        # The pool may be closed from another thread than the event loop.
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[Connection]:
+        async with self._slots:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    # The request failed before it committed.
+                    conn.rollback()
+                with self._lock:
+                    reused = not self._closed
+                    if reused:
+                        self._idle.append(conn)
+                if not reused:
+                    conn.close()
+
+    def close(self) -> None:
+        """Close the idle connections, and the others once they are given back."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _connect(self) -> Connection:
+        # Checked out by one request at a time, even if its threads change. The
+        # path may be a `file:` URI, to open the database with options.
+        return sqlite3.connect(
+            self.path, check_same_thread=False, uri=True, factory=TimedConnection
+        )
+
+
+pool = ConnectionPool(DATABASE_PATH, POOL_SIZE)
+export_pool = ConnectionPool(DATABASE_PATH, EXPORT_POOL_SIZE)
+writer = GroupCommitWriter(DATABASE_PATH)
+
+
+# Dependency
+async def get_cursor() -> AsyncIterator[Cursor]:
+    async with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+
+def enable_wal(cursor: Cursor):
+    # Readers keep going while a write is committed; the mode stays set in the file.
+    cursor.execute("PRAGMA journal_mode = WAL")
+
+
+# AUTOINCREMENT: the id of a deleted post is never given to a new one, which
+# would start again at version 1 and match the ETags sent for the deleted post.
+CREATE_POSTS = """
+    CREATE TABLE posts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT,
+        content TEXT,
+        version INTEGER NOT NULL DEFAULT 1
+    )
+"""
+
+# Keep the full-text index in step with the posts.
+CREATE_POSTS_FTS_TRIGGERS = """
+    CREATE TRIGGER posts_fts_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts (rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END;
+    CREATE TRIGGER posts_fts_delete AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts (posts_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END;
+    CREATE TRIGGER posts_fts_update AFTER UPDATE OF title, content ON posts BEGIN
+        INSERT INTO posts_fts (posts_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO posts_fts (rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END;
+"""
+
 
 def create_posts_table(conn: Connection, cursor: Cursor):
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='posts'")
     table_exists = cursor.fetchone()
 
     if not table_exists:
-        cursor.execute("""
-            CREATE TABLE posts (
-                id INTEGER PRIMARY KEY,
-                title TEXT,
-                content TEXT
-            )
-        """)
+        cursor.execute(CREATE_POSTS)
         print("Table 'posts' created.")
+
+    cursor.execute("SELECT 1 FROM pragma_table_info('posts') WHERE name = 'version'")
+    version_exists = cursor.fetchone()
+
+    if not version_exists:
+        # Counts the updates of a post, to detect concurrent ones.
+        cursor.execute(
+            "ALTER TABLE posts ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+        )
+        print("Column 'posts.version' added.")
+
+    cursor.execute(
+        "SELECT sql LIKE '%AUTOINCREMENT%' FROM sqlite_master WHERE name = 'posts'"
+    )
+    (autoincrement,) = cursor.fetchone()
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='posts_fts'"
+    )
+    index_exists = cursor.fetchone()
+
+    if not autoincrement:
+        # The table is copied into one created with AUTOINCREMENT, keeping the
+        # ids, so the index still refers to the right posts. Its triggers go
+        # with the old table and are created again on the new one.
+        triggers = CREATE_POSTS_FTS_TRIGGERS if index_exists else ""
+        cursor.executescript(f"""
+            BEGIN;
+            ALTER TABLE posts RENAME TO posts_old;
+            {CREATE_POSTS};
+            INSERT INTO posts (id, title, content, version)
+            SELECT id, title, content, version FROM posts_old;
+            DROP TABLE posts_old;
+            {triggers}
+            COMMIT;
+        """)
+        print("Table 'posts' rebuilt with AUTOINCREMENT.")
+
+    if not index_exists:
+        # A full-text index over the posts, storing no copy of their text, which
+        # the triggers keep in step with them. The posts written before it
+        # existed are indexed by the rebuild.
+        cursor.executescript(f"""
+            BEGIN;
+            CREATE VIRTUAL TABLE posts_fts USING fts5(
+                title,
+                content,
+                content='posts',
+                content_rowid='id'
+            );
+            {CREATE_POSTS_FTS_TRIGGERS}
+            INSERT INTO posts_fts (posts_fts) VALUES ('rebuild');
+            COMMIT;
+        """)
+        print("Table 'posts_fts' created.")
     conn.commit()
+
+
+def init_db():
+    while True:
+        try:
+            with closing(sqlite3.connect(DATABASE_PATH)) as conn:
+                cursor = conn.cursor()
+                enable_wal(cursor)
+                create_posts_table(conn, cursor)
+            break
+        except sqlite3.Error as error:
+            print("Connecting to database failed!")
+            print(f"Connection Error: {error}")
+            print("Waiting for 5 seconds...")
+            time.sleep(5)
@@ -0,0 +1,9 @@
+from fastapi import HTTPException, status
+
+
+class PreconditionFailed(HTTPException):
+    def __init__(self, post_id: int):
+        super().__init__(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=f"Post {post_id} was changed since the version given in If-Match!",
+        )
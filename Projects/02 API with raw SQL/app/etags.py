@@ -0,0 +1,22 @@
+import re
+
+from errors import PreconditionFailed
+from models import INT64_MAX
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def if_match_version(post_id: int, if_match: str | None) -> int | None:
+    """The version of the post an If-Match header requires, None for any version.
+
+    Only a single strong ETag, as sent by the routes, can match a version: its
+    digits are ASCII ones, and it fits in the int64 column of the versions.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = re.fullmatch(r'"([0-9]+)"', if_match.strip())
+    if tag is None or int(tag[1]) > INT64_MAX:
+        raise PreconditionFailed(post_id)
+    return int(tag[1])
@@ -1,35 +1,47 @@
-import sqlite3
-import time
+import json
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from sqlite3 import Cursor
 
-from database import create_posts_table
-from fastapi import FastAPI, HTTPException, status
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
+import queries
+from bulk import import_posts
+from config import settings
+from database import export_pool, get_cursor, init_db, pool, writer
+from etags import etag, if_match_version
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from metrics import metrics_response, time_request
+from models import INT64_MAX, Post, UpdatePost
+from replica import get_read_cursor, replica
 
-app = FastAPI()
+# The rows read from the cursor, encoded and sent together when streaming.
+STREAM_BATCH_SIZE = 500
 
 
-class Post(BaseModel):
-    title: str
-    content: str
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    writer.start()
+    if replica:
+        replica.start()
+    yield
+    if replica:
+        replica.close()
+    writer.close()
+    pool.close()
+    export_pool.close()
 
 
-class UpdatePost(BaseModel):
-    title: str | None = None
-    content: str | None = None
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(time_request)
 
 
-while True:
-    try:
-        conn = sqlite3.connect("db.sqlite", check_same_thread=False)
-        cursor = conn.cursor()
-        create_posts_table(conn, cursor)
-        break
-    except sqlite3.Error as error:
-        print("Connecting to database failed!")
-        print(f"Connection Error: {error}")
-        print("Waiting for 5 seconds...")
-        time.sleep(5)
+init_db()
+
+
+def json_response(body: str, headers: dict[str, str] | None = None) -> Response:
+    """Send JSON rendered by SQLite as it is."""
+    return Response(body, headers=headers, media_type="application/json")
 
 
 @app.get("/")
@@ -41,63 +53,113 @@ def index():
     return HTMLResponse(content)
 
 
+@app.get("/metrics")
+def read_metrics():
+    return metrics_response()
+
+
 @app.post("/posts", status_code=status.HTTP_201_CREATED)
-def create_post(post: Post):
-    cursor.execute(
-        """INSERT INTO posts (title, content)
-        VALUES (?, ?)
-        RETURNING *""",
-        (post.title, post.content),
-    )
-    new_post = cursor.fetchone()
-    conn.commit()
+async def create_post(post: Post, response: Response):
+    new_post = await writer.apply(queries.insert_post(post))
+    response.headers["ETag"] = etag(new_post[3])
     return {"post_detail": new_post}
 
 
+@app.post("/posts/bulk", status_code=status.HTTP_201_CREATED)
+async def create_posts(request: Request):
+    return await import_posts(request)
+
+
 @app.get("/posts")
-def read_posts():
-    cursor.execute("SELECT * FROM posts")
+def read_posts(
+    after_id: int = Query(0, ge=0, le=INT64_MAX),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Cursor = Depends(get_read_cursor),
+):
+    # Seeks to the page through the primary key, however far it is.
+    page = {"after_id": after_id, "limit": limit}
+    if settings.render_json_in_sqlite:
+        cursor.execute(queries.PAGE_JSON, page)
+        return json_response(cursor.fetchone()[0])
+    cursor.execute(queries.PAGE, page)
+    posts = cursor.fetchall()
+    next_after_id = posts[-1][0] if len(posts) == limit else None
+    return {"posts": posts, "next_after_id": next_after_id}
+
+
+async def stream_posts(after_id: int) -> AsyncIterator[bytes]:
+    """Yield the posts after `after_id` as JSON lines, a batch of rows at a time.
+
+    The connection is held until the last batch is sent, so the posts are read
+    from a single snapshot of the table. It comes from the pool of the streams,
+    and the query and batches are run on the threadpool.
+    """
+    async with export_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            await run_in_threadpool(cursor.execute, queries.ALL_AFTER, (after_id,))
+            while posts := await run_in_threadpool(cursor.fetchmany, STREAM_BATCH_SIZE):
+                yield "".join(json.dumps(post) + "\n" for post in posts).encode()
+        finally:
+            cursor.close()
+
+
+@app.get("/posts/stream")
+async def export_posts(after_id: int = Query(0, ge=0, le=INT64_MAX)):
+    return StreamingResponse(stream_posts(after_id), media_type="application/x-ndjson")
+
+
+@app.get("/posts/search")
+def search_posts(
+    q: str = Query(min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    cursor: Cursor = Depends(get_cursor),
+):
+    query = queries.match_all_terms(q)
+    if not query:
+        return {"posts": []}
+    cursor.execute(queries.SEARCH, (query, limit, offset))
     posts = cursor.fetchall()
     return {"posts": posts}
 
 
 @app.get("/posts/{post_id}")
-def read_post(post_id: int):
-    cursor.execute("""Select * FROM posts WHERE id = ?""", (post_id,))
+def read_post(
+    post_id: int, response: Response, cursor: Cursor = Depends(get_read_cursor)
+):
+    if settings.render_json_in_sqlite:
+        cursor.execute(queries.POST_JSON, (post_id,))
+    else:
+        cursor.execute(queries.POST, (post_id,))
     post = cursor.fetchone()
     if not post:
         raise HTTPException(status_code=404, detail=f"No post with {post_id=} found!")
+    if settings.render_json_in_sqlite:
+        body, version = post
+        return json_response(body, headers={"ETag": etag(version)})
+    response.headers["ETag"] = etag(post[3])
     return {"post_detail": post}
 
 
 @app.put("/posts/{post_id}", status_code=status.HTTP_202_ACCEPTED)
-def update_post(post_id: int, post: UpdatePost):
-    cursor.execute("""Select * FROM posts WHERE id = ?""", (post_id,))
-    db_post: tuple[int, str, str] | None = cursor.fetchone()
-    if not db_post:
+async def update_post(
+    post_id: int,
+    post: UpdatePost,
+    response: Response,
+    if_match: str | None = Header(None),
+):
+    version = if_match_version(post_id, if_match)
+    updated_post = await writer.apply(queries.update_post(post_id, post, version))
+    if not updated_post:
         raise HTTPException(status_code=404, detail=f"No post with {post_id=} found!")
-    title = post.title or db_post[1]
-    content = post.content or db_post[2]
-    cursor.execute(
-        """Update posts SET
-        title = ?, content = ? WHERE id = ?
-        RETURNING *""",
-        (title, content, post_id),
-    )
-    updated_post = cursor.fetchone()
-    conn.commit()
+    response.headers["ETag"] = etag(updated_post[3])
     return {"updated_post_detail": updated_post}
 
 
 @app.delete("/posts/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_post(post_id: int):
-    cursor.execute(
-        """DELETE FROM posts
-        WHERE id = ?
-        RETURNING *""",
-        (post_id,),
-    )
-    post = cursor.fetchone()
-    conn.commit()
+async def delete_post(post_id: int, if_match: str | None = Header(None)):
+    version = if_match_version(post_id, if_match)
+    post = await writer.apply(queries.delete_post(post_id, version))
     if not post:
         raise HTTPException(status_code=404, detail=f"No post with {post_id=} found!")
@@ -0,0 +1,179 @@
+import functools
+import sqlite3
+import time
+from collections.abc import Callable
+from typing import Any
+
+from fastapi import Request
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+# From tens of microseconds, for lookups by key, to seconds, for bulk writes.
+STATEMENT_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+statement_seconds = Histogram(
+    "sqlite_statement_duration_seconds",
+    "Time spent in SQLite running a statement and fetching its rows.",
+    ["statement"],
+    buckets=STATEMENT_BUCKETS,
+)
+statement_rows = Counter(
+    "sqlite_statement_rows",
+    "Rows returned by a statement.",
+    ["statement"],
+)
+commit_seconds = Histogram(
+    "sqlite_commit_duration_seconds",
+    "Time spent committing a transaction, syncing it to disk included.",
+    buckets=STATEMENT_BUCKETS,
+)
+request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to starting its response.",
+    ["method", "route"],
+)
+
+
+def normalize(sql: str) -> str:
+    """The statement as a label: its words separated by single spaces.
+
+    The statements take their values as parameters, so their text does not
+    vary from one call to the next.
+    """
+    return " ".join(sql.split())
+
+
+@functools.cache
+def statement_metrics(statement: str) -> tuple[Histogram, Counter]:
+    """The metrics of a statement, looked up once rather than on every call."""
+    return statement_seconds.labels(statement), statement_rows.labels(statement)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """A cursor recording how long each statement it runs takes in SQLite.
+
+    The time of a statement adds up its execution and the fetches of its rows,
+    leaving out whatever the caller does in between. It is recorded once the
+    statement returns no more rows, when the cursor runs the next one, or when
+    it is closed.
+    """
+
+    _statement: str | None = None
+    _seconds = 0.0
+    _rows = 0
+
+    def execute(self, sql: str, parameters: Any = (), /) -> "TimedCursor":
+        self._record()
+        self._statement = normalize(sql)
+        self._timed(super().execute, sql, parameters)
+        if self.description is None:
+            # The statement returns no rows.
+            self._record()
+        return self
+
+    def executemany(self, sql: str, parameters: Any, /) -> "TimedCursor":
+        self._record()
+        self._statement = normalize(sql)
+        self._timed(super().executemany, sql, parameters)
+        self._record()
+        return self
+
+    def fetchone(self) -> Any:
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._record()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size: int | None = None) -> list:
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        self._rows += len(rows)
+        if len(rows) < size:
+            self._record()
+        return rows
+
+    def fetchall(self) -> list:
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._record()
+        return rows
+
+    def close(self) -> None:
+        self._record()
+        super().close()
+
+    def _timed(self, method: Callable, *args: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._seconds += time.perf_counter() - started
+
+    def _record(self) -> None:
+        if self._statement is None:
+            return
+        if self._statement == "COMMIT":
+            commit_seconds.observe(self._seconds)
+        else:
+            seconds, rows = statement_metrics(self._statement)
+            seconds.observe(self._seconds)
+            rows.inc(self._rows)
+        self._statement = None
+        self._seconds = 0.0
+        self._rows = 0
+
+
+class TimedConnection(sqlite3.Connection):
+    """A connection whose cursors and commits are timed.
+
+    Pass it as the `factory` of `sqlite3.connect()`.
+    """
+
+    def cursor(self, factory: type[sqlite3.Cursor] = TimedCursor) -> sqlite3.Cursor:
+        return super().cursor(factory)
+
+    # The shortcuts of sqlite3.Connection make their cursors without cursor().
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, parameters: Any, /) -> sqlite3.Cursor:
+        return self.cursor().executemany(sql, parameters)
+
+    def commit(self) -> None:
+        with commit_seconds.time():
+            super().commit()
+
+
+async def time_request(request: Request, call_next: Callable) -> Response:
+    """Middleware recording the time of each request, by route."""
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Matched once the request is routed; the path template keeps the labels few.
+    route = request.scope.get("route")
+    request_seconds.labels(
+        request.method, route.path if route else "unmatched"
+    ).observe(time.perf_counter() - started)
+    return response
+
+
+def metrics_response() -> Response:
+    """The metrics of the process, in the Prometheus text format."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
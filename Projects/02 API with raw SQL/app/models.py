@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+
+# The largest id SQLite stores.
+INT64_MAX = 2**63 - 1
+
+
+class Post(BaseModel):
+    title: str
+    content: str
+
+
+class UpdatePost(BaseModel):
+    title: str | None = None
+    content: str | None = None
@@ -0,0 +1,108 @@
+from sqlite3 import Cursor
+
+from errors import PreconditionFailed
+from models import Post, UpdatePost
+from writer import Write
+
+# The statements of the routes, shared by the sync and the async app.
+
+PAGE = "SELECT * FROM posts WHERE id > :after_id ORDER BY id LIMIT :limit"
+# The same page, written as the JSON of the response by SQLite. A full page may
+# be followed by others, read from its last id.
+PAGE_JSON = """SELECT json_object(
+    'posts', json_group_array(json_array(id, title, content, version)),
+    'next_after_id', CASE WHEN count(*) = :limit THEN max(id) END
+)
+FROM (SELECT * FROM posts WHERE id > :after_id ORDER BY id LIMIT :limit)"""
+ALL_AFTER = "SELECT * FROM posts WHERE id > ? ORDER BY id"
+POST = "Select * FROM posts WHERE id = ?"
+# With the version of the post, for its ETag.
+POST_JSON = """SELECT
+    json_object('post_detail', json_array(id, title, content, version)),
+    version
+FROM posts WHERE id = ?"""
+SEARCH = """SELECT posts.*,
+    snippet(posts_fts, -1, '<mark>', '</mark>', '…', 16)
+FROM posts_fts JOIN posts ON posts.id = posts_fts.rowid
+WHERE posts_fts MATCH ?
+ORDER BY bm25(posts_fts)
+LIMIT ? OFFSET ?"""
+
+
+def match_all_terms(q: str) -> str:
+    """Build an FTS5 query matching the posts containing every word of `q`.
+
+    Each word is quoted, so characters of the FTS5 query syntax are searched
+    for literally.
+    """
+    return " ".join('"' + term.replace('"', '""') + '"' for term in q.split())
+
+
+# The writes, run by the writer thread.
+
+
+def insert_post(post: Post) -> Write:
+    def insert(cursor: Cursor):
+        cursor.execute(
+            """INSERT INTO posts (title, content)
+            VALUES (?, ?)
+            RETURNING *""",
+            (post.title, post.content),
+        )
+        return cursor.fetchone()
+
+    return insert
+
+
+def insert_posts(posts: list[tuple[str, str]]) -> Write:
+    """Insert (title, content) rows; the write returns the first and last ids given."""
+
+    def insert(cursor: Cursor):
+        cursor.executemany("INSERT INTO posts (title, content) VALUES (?, ?)", posts)
+        cursor.execute("SELECT last_insert_rowid()")
+        (last_id,) = cursor.fetchone()
+        # Each row gets the id after the previous one, as the writer is alone.
+        return last_id - len(posts) + 1, last_id
+
+    return insert
+
+
+def update_post(post_id: int, post: UpdatePost, version: int | None) -> Write:
+    """Update the fields given, if the post is at `version` unless it is None."""
+
+    def update(cursor: Cursor):
+        cursor.execute(
+            """Update posts SET
+            title = coalesce(?, title),
+            content = coalesce(?, content),
+            version = version + 1
+            WHERE id = ? AND version = coalesce(?, version)
+            RETURNING *""",
+            (post.title or None, post.content or None, post_id, version),
+        )
+        return cursor.fetchone() or changed_since(cursor, post_id, version)
+
+    return update
+
+
+def delete_post(post_id: int, version: int | None) -> Write:
+    """Delete the post, if it is at `version` unless it is None."""
+
+    def delete(cursor: Cursor):
+        cursor.execute(
+            """DELETE FROM posts
+            WHERE id = ? AND version = coalesce(?, version)
+            RETURNING *""",
+            (post_id, version),
+        )
+        return cursor.fetchone() or changed_since(cursor, post_id, version)
+
+    return delete
+
+
+def changed_since(cursor: Cursor, post_id: int, version: int | None) -> None:
+    """Raise if the post a write missed exists, so it was not at `version`."""
+    if version is not None:
+        cursor.execute("SELECT 1 FROM posts WHERE id = ?", (post_id,))
+        if cursor.fetchone():
+            raise PreconditionFailed(post_id)
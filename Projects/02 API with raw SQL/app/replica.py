@@ -0,0 +1,181 @@
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, closing
+from pathlib import Path
+from sqlite3 import Connection, Cursor
+
+from config import settings
+from database import DATABASE_PATH, POOL_SIZE, ConnectionPool, pool
+from fastapi import Query
+
+
+class Snapshot:
+    def __init__(self, path: Path, pool: ConnectionPool, taken_at: float):
+        self.path = path
+        self.pool = pool
+        # When the copy was started, on the time.monotonic() clock.
+        self.taken_at = taken_at
+        # The requests holding the copy, which is deleted once it is retired and
+        # they are all done.
+        self.readers = 0
+        self.retired = False
+
+
+class SnapshotReplica:
+    """A read-only copy of the database, refreshed every `interval` seconds.
+
+    A thread copies the database into a new file with the backup API and swaps
+    it in for the previous copy, whose connections are closed and file deleted
+    once the requests using them are done. A copy is never written after it is
+    made, so it is opened as read-only and immutable, and read without any
+    locking: the reads served from it do not contend with the writes to the
+    database.
+    """
+
+    def __init__(self, path: str, directory: Path, interval: float, size: int):
+        self.path = path
+        self.directory = directory
+        self.interval = interval
+        self.size = size
+        self.snapshot: Snapshot | None = None
+        self._generation = 0
+        # Guards the swaps of the snapshot and the counts of its readers.
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Left by an earlier process with the same id, which did not close.
+        for path in self.directory.glob(f"replica-{os.getpid()}-*"):
+            path.unlink(missing_ok=True)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="replica", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            previous, self.snapshot = self.snapshot, None
+        self._retire(previous)
+
+    @asynccontextmanager
+    async def connection(
+        self, max_staleness: float | None
+    ) -> AsyncIterator[Connection]:
+        """A connection to the copy if it is at most `max_staleness` seconds old,
+        or to the database.
+
+        The copy is held from the moment it is chosen, so it is not deleted while
+        the request waits for a connection to it.
+        """
+        snapshot = self._hold(max_staleness)
+        if snapshot is None:
+            async with pool.connection() as conn:
+                yield conn
+            return
+        try:
+            async with snapshot.pool.connection() as conn:
+                yield conn
+        finally:
+            self._release(snapshot)
+
+    def refresh(self) -> None:
+        taken_at = time.monotonic()
+        self._generation += 1
+        # Each process of the server keeps its own copies.
+        path = self.directory / f"replica-{os.getpid()}-{self._generation}.sqlite"
+        with closing(sqlite3.connect(self.path)) as source:
+            with closing(sqlite3.connect(path)) as copy:
+                source.backup(copy)
+                # The copy is read-only: it needs no write-ahead log.
+                copy.execute("PRAGMA journal_mode = DELETE")
+        # Read-only: were the file gone, opening it would fail rather than create
+        # an empty database.
+        replica_pool = ConnectionPool(f"file:{path}?mode=ro&immutable=1", self.size)
+        with self._lock:
+            previous, self.snapshot = self.snapshot, Snapshot(
+                path, replica_pool, taken_at
+            )
+        self._retire(previous)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+            except sqlite3.Error as error:
+                print(f"Refreshing the replica failed: {error}")
+            self._stopped.wait(self.interval)
+
+    def _hold(self, max_staleness: float | None) -> Snapshot | None:
+        """Count a reader of the copy, if it is recent enough for it."""
+        if max_staleness is None:
+            return None
+        with self._lock:
+            # A retired copy is no longer the current one, so it is never held
+            # again: the reads then go to the database.
+            snapshot = self.snapshot
+            if snapshot is None:
+                return None
+            if time.monotonic() - snapshot.taken_at > max_staleness:
+                return None
+            snapshot.readers += 1
+        return snapshot
+
+    def _release(self, snapshot: Snapshot) -> None:
+        with self._lock:
+            snapshot.readers -= 1
+            done = snapshot.retired and snapshot.readers == 0
+        if done:
+            self._delete(snapshot)
+
+    def _retire(self, snapshot: Snapshot | None) -> None:
+        if snapshot is None:
+            return
+        # The connections in use are closed as they are given back.
+        snapshot.pool.close()
+        with self._lock:
+            snapshot.retired = True
+            done = snapshot.readers == 0
+        if done:
+            self._delete(snapshot)
+
+    def _delete(self, snapshot: Snapshot) -> None:
+        for path in (
+            snapshot.path,
+            snapshot.path.with_name(snapshot.path.name + "-journal"),
+        ):
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as error:
+                print(f"Deleting the replica {path} failed: {error}")
+
+
+replica = (
+    SnapshotReplica(
+        DATABASE_PATH, settings.replica_dir, settings.replica_interval, POOL_SIZE
+    )
+    if settings.replica_interval
+    else None
+)
+
+
+# Dependency
+async def get_read_cursor(
+    max_staleness: float | None = Query(None, ge=0),
+) -> AsyncIterator[Cursor]:
+    """A cursor on the replica if the caller accepts its staleness, in seconds, or
+    on the database."""
+    connection = replica.connection(max_staleness) if replica else pool.connection()
+    async with connection as conn:
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
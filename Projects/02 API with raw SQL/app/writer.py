@@ -0,0 +1,120 @@
+import asyncio
+import sqlite3
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future
+from queue import Empty, SimpleQueue
+from sqlite3 import Cursor
+from typing import Any
+
+from metrics import TimedConnection
+
+# The most writes committed together; the others wait for the next commit.
+MAX_GROUP_SIZE = 256
+
+Write = Callable[[Cursor], Any]
+
+
+class GroupCommitWriter:
+    """A thread applying the writes of concurrent requests in shared transactions.
+
+    A write is a function of a cursor, submitted from any thread. The writer
+    takes all the writes waiting when it becomes free and runs them in a single
+    transaction, each under a savepoint so that a failing write is undone alone.
+    The future of every write resolves once the transaction is committed, so a
+    request is answered after its changes are on disk, yet concurrent requests
+    share the cost of one commit.
+    """
+
+    def __init__(self, path: str, max_group_size: int = MAX_GROUP_SIZE):
+        self.path = path
+        self.max_group_size = max_group_size
+        self._queue: SimpleQueue[tuple[Write, Future] | None] = SimpleQueue()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="writer", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Commit the writes already submitted, then stop the thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, write: Write) -> Future:
+        """Schedule `write`; its future holds what it returned once committed."""
+        future = Future()
+        self._queue.put((write, future))
+        return future
+
+    async def apply(self, write: Write) -> Any:
+        """Schedule `write` and return what it returned once committed."""
+        return await asyncio.wrap_future(self.submit(write))
+
+    def _run(self) -> None:
+        # Transactions are opened and committed explicitly.
+        conn = sqlite3.connect(self.path, isolation_level=None, factory=TimedConnection)
+        cursor = conn.cursor()
+        # Sync the log at every commit: a write answered is a write kept.
+        cursor.execute("PRAGMA synchronous = FULL")
+        try:
+            while group := self._next_group():
+                self._commit(cursor, group)
+        finally:
+            conn.close()
+
+    def _next_group(self) -> list[tuple[Write, Future]]:
+        """Wait for a write, then take the others already waiting.
+
+        Returns an empty list once the writer is closed.
+        """
+        group = []
+        item = self._queue.get()
+        while item is not None:
+            group.append(item)
+            if len(group) == self.max_group_size:
+                break
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                break
+        else:
+            if group:
+                # Stop after committing this group.
+                self._queue.put(None)
+        return group
+
+    def _commit(self, cursor: Cursor, group: list[tuple[Write, Future]]) -> None:
+        group = [
+            (write, future)
+            for write, future in group
+            if future.set_running_or_notify_cancel()
+        ]
+        if not group:
+            return
+        outcomes = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for write, _ in group:
+                cursor.execute("SAVEPOINT write")
+                try:
+                    outcomes.append((write(cursor), None))
+                    cursor.execute("RELEASE write")
+                except Exception as error:
+                    cursor.execute("ROLLBACK TO write")
+                    cursor.execute("RELEASE write")
+                    outcomes.append((None, error))
+            cursor.execute("COMMIT")
+        except sqlite3.Error as error:
+            if cursor.connection.in_transaction:
+                cursor.execute("ROLLBACK")
+            for _, future in group:
+                future.set_exception(error)
+            return
+        for (_, future), (result, error) in zip(group, outcomes):
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
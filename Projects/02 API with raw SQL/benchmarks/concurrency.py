@@ -0,0 +1,177 @@
+"""Compare the sync app (`main.py`) with the async one (`async_main.py`) under load.
+
+The database is seeded with a number of posts, then each app is started with
+uvicorn and called over HTTP by a growing number of concurrent keep-alive
+connections, reading single posts and pages of posts in turn. The p50/p99 latency, the
+throughput and the failed requests at every level are reported as JSON. Run from
+the project directory:
+
+    python benchmarks/concurrency.py --posts 100000 --concurrency 50 200 1000
+
+The sync routes each hold one of the threads of FastAPI's threadpool (40 by
+default) while they run, the async ones none. If the threadpool was what limits
+the sync app, it would fall behind as the concurrency grows past its size.
+
+Both apps use the same database, created in a temporary directory, and the same
+server options. The client is a minimal HTTP/1.1 one, so that it takes little
+of the CPU it shares with the server; it runs in this process.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+APPS = ("main", "async_main")
+SEED_BATCH = 10_000
+PAGE_SIZE = 20
+
+
+def seed(path: str, posts: int) -> None:
+    sys.path.insert(0, str(APP_DIR))
+    from database import create_posts_table, enable_wal
+
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    enable_wal(cursor)
+    create_posts_table(conn, cursor)
+    for start in range(0, posts, SEED_BATCH):
+        conn.executemany(
+            "INSERT INTO posts (title, content) VALUES (?, ?)",
+            (
+                (f"Post {i}", f"Post number {i}: ".ljust(300, "x"))
+                for i in range(start, min(start + SEED_BATCH, posts))
+            ),
+        )
+    conn.commit()
+    conn.close()
+
+
+def urls(posts: int, requests: int) -> list[str]:
+    """Every other call reads a post, the others a page of posts."""
+    rng = random.Random(0)
+    return [
+        (
+            f"/posts/{rng.randint(1, posts)}"
+            if i % 2
+            else f"/posts?limit={PAGE_SIZE}&after_id={rng.randint(0, posts)}"
+        )
+        for i in range(requests)
+    ]
+
+
+async def get(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, url: str
+) -> int:
+    """Send a GET request on a kept-alive connection; return the response status."""
+    writer.write(f"GET {url} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = re.search(rb"(?i)content-length: *(\d+)", head)
+    await reader.readexactly(int(length[1]))
+    return int(head[9:12])
+
+
+async def measure(port: int, targets: list[str], concurrency: int) -> dict:
+    """Call the URLs over `concurrency` connections, each sending a request after
+    the response to the previous one."""
+    latencies = []
+    failures = 0
+    queue = iter(targets)
+
+    async def connection() -> None:
+        nonlocal failures
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            for url in queue:
+                started = time.perf_counter()
+                try:
+                    if await get(reader, writer, url) != 200:
+                        failures += 1
+                except (OSError, asyncio.IncompleteReadError):
+                    failures += 1
+                    writer.close()
+                    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                latencies.append(time.perf_counter() - started)
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(connection() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+    return {
+        "concurrency": concurrency,
+        "requests": len(targets),
+        "failed": failures,
+        "p50_ms": round(p50, 2),
+        "p99_ms": round(p99, 2),
+        "throughput_rps": round(len(targets) / elapsed, 1),
+    }
+
+
+async def run_app(app: str, directory: str, args: argparse.Namespace) -> dict:
+    command = [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        f"{app}:app",
+        "--app-dir",
+        str(APP_DIR),
+        "--port",
+        str(args.port),
+        "--log-level",
+        "warning",
+        "--backlog",
+        str(max(args.concurrency) * 2),
+    ]
+    server = subprocess.Popen(command, cwd=directory)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{args.port}"
+        ) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+        targets = urls(args.posts, args.requests)
+        # Warm the connections and the page cache.
+        await measure(args.port, targets[: args.requests // 10], 10)
+        levels = [
+            await measure(args.port, targets, concurrency)
+            for concurrency in args.concurrency
+        ]
+        return {"app": app, "levels": levels}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--port", type=int, default=8124)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        seed(str(Path(directory) / "db.sqlite"), args.posts)
+        runs = [asyncio.run(run_app(app, directory, args)) for app in APPS]
+    print(json.dumps({"posts": args.posts, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Compare the JSON rendering of the posts read by SQLite with the tuple path.
+
+The database is seeded with a number of posts, then `GET /posts` (with a few page
+sizes) and `GET /posts/{id}` are called with `render_json_in_sqlite` off, where
+the routes encode the rows SQLite returns, and on, where SQLite writes the
+response body. Both must return the same posts. The mean latency of each and the
+speedup are reported as JSON. Run from the project directory:
+
+    python benchmarks/json_rendering.py --posts 100000 --limits 10 100 1000
+
+The app runs in this process, driven through an in-process ASGI client, so the
+figures leave out the network and the server. The database is created in a
+temporary directory.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+SEED_BATCH = 10_000
+
+
+def seed(path: str, posts: int, content_size: int) -> None:
+    conn = sqlite3.connect(path)
+    for start in range(0, posts, SEED_BATCH):
+        conn.executemany(
+            "INSERT INTO posts (title, content) VALUES (?, ?)",
+            (
+                (f"Post {i}", f"Post number {i}: ".ljust(content_size, "x"))
+                for i in range(start, min(start + SEED_BATCH, posts))
+            ),
+        )
+    conn.commit()
+    conn.close()
+
+
+async def mean_latency(
+    client: httpx.AsyncClient, urls: list[str]
+) -> tuple[float, list[object]]:
+    """Call every URL in turn; return the mean seconds per call and the bodies."""
+    bodies = []
+    start = time.perf_counter()
+    for url in urls:
+        response = await client.get(url)
+        response.raise_for_status()
+        bodies.append(response.content)
+    elapsed = time.perf_counter() - start
+    return elapsed / len(urls), [json.loads(body) for body in bodies]
+
+
+async def compare(app_module, posts: int, limits: list[int], calls: int) -> list[dict]:
+    transport = httpx.ASGITransport(app=app_module.app)
+    cases = [
+        (f"GET /posts?limit={limit}", f"/posts?after_id={{}}&limit={limit}", limit)
+        for limit in limits
+    ]
+    cases.append(("GET /posts/{id}", "/posts/{}", 1))
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+        for name, template, span in cases:
+            # Spread the calls over the posts, every read staying within them.
+            last_start = max(posts - span, 1)
+            urls = [template.format(1 + i * last_start // calls) for i in range(calls)]
+            timings = {}
+            bodies = {}
+            for mode in (False, True):
+                app_module.settings.render_json_in_sqlite = mode
+                # Warm the caches, then measure.
+                await mean_latency(client, urls[:10])
+                timings[mode], bodies[mode] = await mean_latency(client, urls)
+            assert bodies[False] == bodies[True], f"{name}: the bodies differ"
+            results.append(
+                {
+                    "endpoint": name,
+                    "tuples_ms": round(timings[False] * 1000, 3),
+                    "sqlite_json_ms": round(timings[True] * 1000, 3),
+                    "speedup": round(timings[False] / timings[True], 2),
+                }
+            )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--limits", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--content-size", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # The app opens `db.sqlite` in the working directory when imported.
+        os.chdir(directory)
+        sys.path.insert(0, str(APP_DIR))
+        import main as app_module
+
+        seed(os.path.join(directory, "db.sqlite"), args.posts, args.content_size)
+        results = asyncio.run(compare(app_module, args.posts, args.limits, args.calls))
+        app_module.pool.close()
+    print(json.dumps({"posts": args.posts, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import pytest
+from errors import PreconditionFailed
+from etags import etag, if_match_version
+
+
+@pytest.mark.parametrize(
+    "if_match, version",
+    [(None, None), ("*", None), (' "3" ', 3), (etag(2**63 - 1), 2**63 - 1)],
+)
+def test_if_match_version(if_match, version):
+    assert if_match_version(1, if_match) == version
+
+
+@pytest.mark.parametrize(
+    "if_match",
+    [
+        '"²"',  # A digit to str.isdigit(), but not to int().
+        '"99999999999999999999"',  # Beyond the int64 versions.
+        str(2**63),
+        '"3',
+        'W/"3"',
+        '"3", "4"',
+        '""',
+        '"-1"',
+    ],
+)
+def test_if_match_version_rejects(if_match):
+    with pytest.raises(PreconditionFailed) as error:
+        if_match_version(1, if_match)
+    assert error.value.status_code == 412